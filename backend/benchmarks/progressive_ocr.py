@@ -0,0 +1,62 @@
+"""
+Progressive OCR Benchmark
+Compares CPU time per page of the single full-resolution pass with the
+progressive draft + refinement passes. Tesseract and pdftoppm run as child
+processes, so their CPU time is counted through RUSAGE_CHILDREN.
+
+Usage (from backend/):
+    python -m benchmarks.progressive_ocr document.pdf --language eng
+"""
+
+import sys
+import time
+import resource
+import argparse
+from difflib import SequenceMatcher
+from typing import Callable, Dict, Any, List
+
+from src.ocr_engines import TesseractEngine
+
+def cpu_seconds() -> float:
+    """CPU time of this process and its waited-for children"""
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return own.ru_utime + own.ru_stime + children.ru_utime + children.ru_stime
+
+def measure(name: str, run: Callable[[], List[Dict[str, Any]]]) -> Dict[str, Any]:
+    started_cpu = cpu_seconds()
+    started = time.perf_counter()
+    pages = run()
+    return {
+        'name': name,
+        'pages': pages,
+        'cpu': cpu_seconds() - started_cpu,
+        'wall': time.perf_counter() - started
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='CPU per page of single-pass vs progressive PDF OCR')
+    parser.add_argument('pdf')
+    parser.add_argument('--language', default='eng+ara')
+    parser.add_argument('--pages', type=int, nargs='+', help='Page numbers (default: all)')
+    args = parser.parse_args(argv)
+
+    engine = TesseractEngine()
+    runs = [
+        measure('single pass', lambda: engine.process_pdf(args.pdf, args.language, args.pages)),
+        measure('progressive', lambda: engine.process_pdf_progressive(args.pdf, args.language, args.pages))
+    ]
+
+    baseline = runs[0]['pages']
+    print(f"{'mode':<14}{'pages':>6}{'cpu s/page':>12}{'wall s/page':>13}{'refined lines':>15}{'text match':>12}")
+    for run in runs:
+        count = max(len(run['pages']), 1)
+        refined = sum(page.get('refined_lines', 0) for page in run['pages'])
+        similarity = sum(
+            SequenceMatcher(None, base.get('text', ''), page.get('text', ''), autojunk=False).ratio()
+            for base, page in zip(baseline, run['pages'])
+        ) / count
+        print(f"{run['name']:<14}{count:>6}{run['cpu'] / count:>12.2f}{run['wall'] / count:>13.2f}{refined:>15}{similarity:>12.3f}")
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,72 @@
+"""
+Response Size Benchmark
+Serialization time and raw/gzip sizes of a synthetic /process response in the
+full, compact and fields=final_text shapes
+
+Usage (from backend/):
+    python -m benchmarks.response_size --pages 100 --words 350
+"""
+
+import gzip
+import random
+import argparse
+from flask import Flask
+
+from src.response_format import format_response, GZIP_LEVEL
+
+WORDS = ['invoice', 'total', 'amount', 'date', 'customer', 'address', 'payment', 'الفاتورة', 'المبلغ', 'التاريخ', 'العميل']
+
+def synthetic_response(pages: int, words: int, seed: int = 0) -> dict:
+    """A single-engine PDF response shaped like /process returns it"""
+    rng = random.Random(seed)
+    page_texts = [' '.join(rng.choice(WORDS) for _ in range(words)) for _ in range(pages)]
+    combined_text = '\n\n'.join(page_texts)
+    # Corrections change a few words, so corrected text is new but the
+    # combined text repeats in several places of the response
+    corrected_text = combined_text.replace('amount', 'Amount')
+    return {
+        'success': True,
+        'file_id': '6f1c1f8e-3b1a-4c57-9a84-0f3b5d2f1e77',
+        'filename': 'document.pdf',
+        'processing_time': '2026-01-01T00:00:00',
+        'ocr_results': {
+            'tesseract': [
+                {'engine': 'tesseract', 'text': text, 'confidence': 87.5, 'word_count': words, 'language': 'eng+ara',
+                 'detected_script': None, 'success': True, 'error': None, 'page_number': number}
+                for number, text in enumerate(page_texts, 1)
+            ]
+        },
+        'combined_result': {'combined_text': combined_text, 'confidence': 87.5, 'method': 'single_engine',
+                            'engines_used': ['tesseract'], 'success': True, 'best_engine': 'tesseract'},
+        'local_correction': {'original_text': combined_text, 'corrected_text': combined_text, 'confidence': 95,
+                             'changes_made': [], 'success': True, 'error': None},
+        'ai_correction': {'original_text': combined_text, 'corrected_text': corrected_text, 'confidence': 90,
+                          'changes_made': ['amount -> Amount'], 'success': True, 'error': None},
+        'final_text': corrected_text,
+        'draft_text': None,
+        'settings': {'engines': ['tesseract'], 'language': 'eng+ara'}
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Measure /process response serialization')
+    parser.add_argument('--pages', type=int, default=100)
+    parser.add_argument('--words', type=int, default=350)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args(argv)
+
+    app = Flask(__name__)
+    data = synthetic_response(args.pages, args.words)
+    shapes = [('full', None, None), ('compact', None, 'compact'), ('fields=final_text', 'final_text', None)]
+
+    with app.app_context():
+        for name, fields, response_format in shapes:
+            timings = []
+            for _ in range(args.repeat):
+                response = format_response(data, fields, response_format)
+                timings.append(float(response.headers['Server-Timing'].split('dur=')[1]))
+            body = response.get_data()
+            compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            print(f"{name:<20}{min(timings):>8.1f} ms{len(body) / 1024:>8.0f} KiB raw{len(compressed) / 1024:>7.0f} KiB gzip")
+
+if __name__ == '__main__':
+    main()
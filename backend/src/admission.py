@@ -0,0 +1,121 @@
+"""
+Admission Control Module
+Limits how much OCR work runs at once based on its estimated pixel memory
+"""
+
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from typing import Dict, Any
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Admission limits, configurable through the environment
+OCR_MEMORY_BUDGET_MB = int(os.getenv('OCR_MEMORY_BUDGET_MB', 2048))
+OCR_MAX_QUEUED = int(os.getenv('OCR_MAX_QUEUED', 8))
+OCR_QUEUE_TIMEOUT = float(os.getenv('OCR_QUEUE_TIMEOUT', 30))
+OCR_RETRY_AFTER = int(os.getenv('OCR_RETRY_AFTER', 10))
+
+class AdmissionRejected(Exception):
+    """Raised when OCR work cannot be admitted within the memory budget"""
+
+    def __init__(self, message: str, retry_after: int = OCR_RETRY_AFTER):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class MemoryBudgetExceeded(AdmissionRejected):
+    """Raised for work whose estimate exceeds the whole memory budget, so retrying cannot help"""
+
+class AdmissionController:
+    """Admits OCR work only while its estimated memory fits the configured budget"""
+
+    def __init__(self, memory_budget: int = OCR_MEMORY_BUDGET_MB * 1024 * 1024,
+                 max_queued: int = OCR_MAX_QUEUED, queue_timeout: float = OCR_QUEUE_TIMEOUT):
+        self.memory_budget = memory_budget
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.memory_in_use = 0
+        self.active = 0
+        self.queued = 0
+        self.admitted_total = 0
+        self.rejected_total = 0
+        self._condition = threading.Condition()
+
+    def _fits(self, cost: int) -> bool:
+        return self.memory_in_use + cost <= self.memory_budget
+
+    def check(self, cost: int):
+        """Raise MemoryBudgetExceeded if the work could never be admitted"""
+        if cost > self.memory_budget:
+            with self._condition:
+                self.rejected_total += 1
+            raise MemoryBudgetExceeded(
+                f'Estimated memory ({cost // (1024 * 1024)} MB) exceeds the OCR memory budget '
+                f'({self.memory_budget // (1024 * 1024)} MB)'
+            )
+
+    def acquire(self, cost: int, wait: bool = False):
+        """
+        Block until the work fits the budget; raise AdmissionRejected if it cannot.
+        With wait=True the queue limit and timeout do not apply: used for work
+        that belongs to an already admitted request and must not be abandoned.
+        """
+        self.check(cost)
+        with self._condition:
+            if not self._fits(cost):
+                if not wait and self.queued >= self.max_queued:
+                    self.rejected_total += 1
+                    raise AdmissionRejected('OCR queue is full, try again later')
+
+                self.queued += 1
+                deadline = None if wait else time.monotonic() + self.queue_timeout
+                try:
+                    while not self._fits(cost):
+                        if deadline is None:
+                            self._condition.wait()
+                            continue
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self.rejected_total += 1
+                            raise AdmissionRejected('Timed out waiting for OCR capacity, try again later')
+                        self._condition.wait(remaining)
+                finally:
+                    self.queued -= 1
+
+            self.memory_in_use += cost
+            self.active += 1
+            self.admitted_total += 1
+
+    def release(self, cost: int):
+        """Return the memory held by finished work and wake up waiting requests"""
+        with self._condition:
+            self.memory_in_use -= cost
+            self.active -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self, cost: int, wait: bool = False):
+        """Context manager holding an admission for the duration of the block"""
+        self.acquire(cost, wait)
+        try:
+            yield
+        finally:
+            self.release(cost)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get the configured limits and current occupancy"""
+        with self._condition:
+            return {
+                'memory_budget_bytes': self.memory_budget,
+                'memory_in_use_bytes': self.memory_in_use,
+                'active_requests': self.active,
+                'queued_requests': self.queued,
+                'max_queued': self.max_queued,
+                'queue_timeout_seconds': self.queue_timeout,
+                'admitted_total': self.admitted_total,
+                'rejected_total': self.rejected_total
+            }
@@ -0,0 +1,320 @@
+"""
+Bulk Processing Module
+Command-line OCR of whole directory trees with a multiprocessing pool,
+incremental JSONL output and a resumable checkpoint manifest
+
+Usage:
+    python -m src.bulk_process /path/to/scans -o results.jsonl --workers 8
+"""
+
+import os
+import sys
+import json
+import time
+import queue
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+from typing import Dict, Any, Iterator, List, Optional, Set
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# File types picked up from the directory tree
+BULK_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff', 'tif', 'pdf', 'txt'}
+
+# Files in flight per worker; bounds memory no matter how large the tree is
+TASKS_PER_WORKER = 4
+
+# Recycle worker processes periodically to cap memory growth in native libraries
+MAX_TASKS_PER_CHILD = 200
+
+# Seconds between progress line updates
+PROGRESS_INTERVAL = 1.0
+
+# Per-process OCR state, created once by the pool initializer
+_ocr_manager = None
+_ai_corrector = None
+_local_corrector = None
+_page_hash_index = None
+
+def _init_worker():
+    """Create the OCR manager and correctors once per worker process"""
+    global _ocr_manager, _ai_corrector, _local_corrector, _page_hash_index
+    from src.ocr_engines import OCRManager
+    from src.ai_corrector import AICorrector
+    from src.local_corrector import LocalCorrector
+    from src.page_hash import PageHashIndex
+
+    logging.getLogger().setLevel(logging.WARNING)
+    _ocr_manager = OCRManager()
+    _ai_corrector = AICorrector()
+    _local_corrector = LocalCorrector()
+    _page_hash_index = PageHashIndex()
+
+def ocr_errors(ocr_results: Dict[str, Any]) -> List[str]:
+    """Errors of every engine result and PDF page that failed; OCR engines report them instead of raising"""
+    errors = []
+    for engine_name, result in ocr_results.items():
+        for page in (result if isinstance(result, list) else [result]):
+            if not page.get('success', False):
+                where = f"{engine_name} page {page['page_number']}" if 'page_number' in page else engine_name
+                errors.append(f"{where}: {page.get('error') or 'OCR failed'}")
+    return errors
+
+def process_path(path: str, digest: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """OCR and correct one file; runs inside a worker process"""
+    started = time.monotonic()
+    file_extension = path.rsplit('.', 1)[1].lower()
+
+    # Each worker keeps its own index of pages it has already OCR'd
+    from src.page_hash import PageDeduplicator
+    deduplicator = PageDeduplicator(_page_hash_index, options['dedup'])
+    dedup = deduplicator if deduplicator.enabled() else None
+
+    try:
+        if file_extension == 'pdf':
+            ocr_results = _ocr_manager.process_pdf(path, options['engines'], options['language'], dedup=dedup,
+                                                   progressive=options['progressive'])
+        elif file_extension == 'txt':
+            with open(path, 'r', encoding='utf-8') as f:
+                ocr_results = {'external': _ocr_manager.process_external_text(f.read(), options['external_engine'])}
+        else:
+            ocr_results = _ocr_manager.process_image(path, options['engines'], options['language'], dedup=dedup)
+
+        if not ocr_results:
+            raise RuntimeError('None of the requested engines are available')
+
+        combined_result = _ocr_manager.combine_document_results(ocr_results, file_extension, options['combination_method'])
+        local_result, ai_result, final_text = _ocr_manager.apply_corrections(
+            combined_result, ocr_results, options['language'], _local_corrector, _ai_corrector,
+            options['ai_correction'], options['context'], options['local_correction']
+        )
+
+        errors = ocr_errors(ocr_results)
+        record = {
+            'path': path,
+            'digest': digest,
+            'success': combined_result['success'],
+            'error': '; '.join(errors) or None,
+            'final_text': final_text,
+            'confidence': combined_result['confidence'],
+            'engines_used': combined_result['engines_used'],
+            'local_changes': len(local_result['changes_made']) if local_result else 0,
+            'ai_changes': len(ai_result['changes_made']) if ai_result else 0,
+            'dedup_stats': deduplicator.get_stats()
+        }
+        if options['include_ocr_results']:
+            record['ocr_results'] = _ocr_manager.without_layout(ocr_results)
+
+    except Exception as e:
+        record = {
+            'path': path,
+            'digest': digest,
+            'success': False,
+            'error': str(e)
+        }
+
+    record['elapsed_seconds'] = round(time.monotonic() - started, 3)
+    return record
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's content, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_files(root: str, extensions: Set[str]) -> Iterator[str]:
+    """Walk a directory tree lazily, yielding supported files in a stable order"""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError as e:
+            logger.warning(f"Cannot read directory {directory}: {e}")
+            continue
+
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+            elif entry.is_file() and '.' in entry.name and entry.name.rsplit('.', 1)[1].lower() in extensions:
+                yield entry.path
+        stack.extend(reversed(subdirectories))
+
+def load_manifest(manifest_path: str) -> Set[str]:
+    """Digests of files finished by earlier runs"""
+    done = set()
+    if not os.path.exists(manifest_path):
+        return done
+
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                # A torn last line from a crash is simply redone
+                try:
+                    done.add(json.loads(line)['digest'])
+                except (ValueError, KeyError):
+                    continue
+    return done
+
+class ProgressReporter:
+    """Prints throughput and ETA on a single, periodically refreshed line"""
+
+    def __init__(self, total: Optional[int], skipped: int = 0):
+        self.total = total
+        self.skipped = skipped
+        self.completed = 0
+        self.failed = 0
+        self.started = time.monotonic()
+        self.last_print = 0.0
+
+    def update(self, success: bool, force: bool = False):
+        self.completed += 1
+        if not success:
+            self.failed += 1
+        self.print(force)
+
+    def print(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self.last_print < PROGRESS_INTERVAL:
+            return
+        self.last_print = now
+
+        elapsed = max(now - self.started, 1e-6)
+        rate = self.completed / elapsed
+        line = f"\r{self.completed} done, {self.failed} failed, {self.skipped} skipped | {rate:.2f} files/s"
+        if self.total is not None:
+            remaining = max(self.total - self.completed - self.skipped, 0)
+            if rate > 0:
+                eta = int(remaining / rate)
+                eta_text = f"{eta // 3600}:{eta % 3600 // 60:02d}:{eta % 60:02d}"
+            else:
+                eta_text = '--:--:--'
+            line += f" | {self.completed + self.skipped}/{self.total} | ETA {eta_text}"
+        sys.stderr.write(line)
+        sys.stderr.flush()
+
+def run(root: str, output_path: str, options: Dict[str, Any], workers: int,
+        extensions: Set[str] = BULK_EXTENSIONS, count_first: bool = True) -> Dict[str, int]:
+    """Process every supported file under root, skipping files already in the manifest"""
+    manifest_path = output_path + '.manifest'
+    done = load_manifest(manifest_path)
+    in_flight = set()
+
+    total = sum(1 for _ in iter_files(root, extensions)) if count_first else None
+    progress = ProgressReporter(total)
+    results = queue.Queue()
+    slots = threading.BoundedSemaphore(workers * TASKS_PER_WORKER)
+
+    def on_done(record):
+        results.put(record)
+        slots.release()
+
+    def on_error(error):
+        results.put({'path': None, 'digest': None, 'success': False, 'error': str(error)})
+        slots.release()
+
+    with open(output_path, 'a', encoding='utf-8') as output, \
+            open(manifest_path, 'a', encoding='utf-8') as manifest, \
+            multiprocessing.Pool(workers, initializer=_init_worker, maxtasksperchild=MAX_TASKS_PER_CHILD) as pool:
+
+        def write(record):
+            # Result first, then the checkpoint, so a crash can only cause a redo
+            output.write(json.dumps(record, ensure_ascii=False) + '\n')
+            output.flush()
+            if record['digest'] is not None:
+                in_flight.discard(record['digest'])
+                # Files with a failed engine or page are retried on the next run;
+                # files OCR'd without errors are done, even if they had no text
+                if record.get('error') is None:
+                    manifest.write(json.dumps({'digest': record['digest'], 'path': record['path']}) + '\n')
+                    manifest.flush()
+                    done.add(record['digest'])
+            progress.update(record['success'])
+
+        def drain(block: bool = False):
+            while True:
+                try:
+                    write(results.get(block=block))
+                except queue.Empty:
+                    return
+                block = False
+
+        submitted = 0
+        for path in iter_files(root, extensions):
+            try:
+                digest = file_digest(path)
+            except OSError as e:
+                logger.warning(f"Cannot read {path}: {e}")
+                continue
+
+            # Finished in an earlier run, or a byte-identical copy already queued
+            if digest in done or digest in in_flight:
+                progress.skipped += 1
+                progress.print()
+                continue
+
+            while not slots.acquire(timeout=PROGRESS_INTERVAL):
+                drain()
+                progress.print()
+            in_flight.add(digest)
+            pool.apply_async(process_path, (path, digest, options), callback=on_done, error_callback=on_error)
+            submitted += 1
+            drain()
+
+        while progress.completed < submitted:
+            drain(block=True)
+
+    progress.print(force=True)
+    sys.stderr.write('\n')
+    return {'processed': progress.completed, 'failed': progress.failed, 'skipped': progress.skipped}
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='OCR every document under a directory tree')
+    parser.add_argument('root', help='Directory to crawl')
+    parser.add_argument('-o', '--output', required=True, help='JSONL file results are appended to')
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 2)
+    parser.add_argument('--engines', nargs='+', default=['tesseract'])
+    parser.add_argument('--language', default='eng+ara')
+    parser.add_argument('--combination-method', default='best_confidence')
+    parser.add_argument('--ai-correction', action='store_true', help='Also run the OpenAI corrector')
+    parser.add_argument('--local-correction', choices=['prepass', 'only', 'off'], default='prepass',
+                        help="'prepass' runs before --ai-correction only; 'only' corrects offline without the LLM")
+    parser.add_argument('--context', default='')
+    parser.add_argument('--dedup', choices=['off', 'reuse', 'verify'], default='off',
+                        help='Reuse OCR results of near-identical pages seen earlier by the same worker')
+    parser.add_argument('--external-engine', default='External OCR', help='Engine name recorded for .txt inputs')
+    parser.add_argument('--progressive', action='store_true',
+                        help='OCR PDFs at low DPI first and re-OCR only low-confidence lines at full DPI')
+    parser.add_argument('--extensions', nargs='+', default=sorted(BULK_EXTENSIONS))
+    parser.add_argument('--include-ocr-results', action='store_true', help='Write per-engine, per-page OCR results too')
+    parser.add_argument('--no-count', action='store_true', help='Skip the initial file count (no ETA)')
+    args = parser.parse_args(argv)
+
+    options = {
+        'engines': args.engines,
+        'language': args.language,
+        'combination_method': args.combination_method,
+        'ai_correction': args.ai_correction,
+        'local_correction': args.local_correction,
+        'context': args.context,
+        'dedup': args.dedup,
+        'progressive': args.progressive,
+        'external_engine': args.external_engine,
+        'include_ocr_results': args.include_ocr_results
+    }
+
+    stats = run(args.root, args.output, options, args.workers,
+                {extension.lower().lstrip('.') for extension in args.extensions}, not args.no_count)
+    print(f"Processed {stats['processed']} files ({stats['failed']} failed), skipped {stats['skipped']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,455 @@
+"""
+Export Module
+Builds hOCR, ALTO XML and searchable PDF files from the word geometry stored
+with OCR results, one page at a time, optionally with corrected text mapped
+back onto the OCR'd words
+"""
+
+import io
+import os
+import zlib
+import unicodedata
+import logging
+from difflib import SequenceMatcher
+from contextlib import nullcontext
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Tuple, Callable, ContextManager
+from xml.sax.saxutils import escape, quoteattr
+from PIL import Image
+from pdf2image import convert_from_path
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Resolution PDF pages are rendered at for the image layer of searchable PDFs
+EXPORT_PDF_DPI = int(os.getenv('EXPORT_PDF_DPI', 150))
+EXPORT_JPEG_QUALITY = int(os.getenv('EXPORT_JPEG_QUALITY', 75))
+
+# Extra corrected tokens looked at beyond a page's word count when aligning,
+# so words the correction inserted do not push the rest of the page out of view
+ALIGN_MIN_SLACK = 20
+
+# Media type and file extension per export format
+EXPORT_FORMATS = {
+    'hocr': ('text/html', '.hocr'),
+    'alto': ('application/xml', '.xml'),
+    'pdf': ('application/pdf', '.pdf')
+}
+
+# (page_number, stored page result or None) as yielded by ResultStore.iter_results
+PageResults = Iterable[Tuple[int, Optional[Dict[str, Any]]]]
+
+def _match_key(token: str) -> str:
+    """Compare tokens without case and punctuation, which corrections often change"""
+    key = ''.join(char for char in token.casefold() if char.isalnum())
+    return key or token
+
+def _is_rtl(text: str) -> bool:
+    return any(unicodedata.bidirectional(char) in ('R', 'AL') for char in text)
+
+def _union(boxes: List[List[int]]) -> Tuple[int, int, int, int]:
+    return (
+        min(box[0] for box in boxes), min(box[1] for box in boxes),
+        max(box[2] for box in boxes), max(box[3] for box in boxes)
+    )
+
+class WordAligner:
+    """
+    Maps corrected document text back onto OCR words. Pages are aligned in
+    order against a moving window of the corrected tokens, so memory and time
+    stay proportional to one page however long the document is.
+    """
+
+    def __init__(self, corrected_text: str):
+        self.tokens = corrected_text.split()
+        self.keys = [_match_key(token) for token in self.tokens]
+        self.position = 0
+
+    def align(self, words: List[str]) -> List[List[str]]:
+        """Corrected tokens for each OCR word of the next page; an empty list means the word was removed"""
+        assigned = [[] for _ in words]
+        if not words:
+            return assigned
+
+        end = min(len(self.tokens), self.position + len(words) + max(ALIGN_MIN_SLACK, len(words) // 4))
+        matcher = SequenceMatcher(None, [_match_key(word) for word in words], self.keys[self.position:end], autojunk=False)
+        opcodes = matcher.get_opcodes()
+
+        # Tokens after the page's last word belong to the next page
+        while opcodes and opcodes[-1][0] == 'insert':
+            opcodes.pop()
+
+        for tag, i1, i2, j1, j2 in opcodes:
+            tokens = self.tokens[self.position + j1:self.position + j2]
+            if tag == 'equal' or (tag == 'replace' and i2 - i1 == j2 - j1):
+                for offset, token in enumerate(tokens):
+                    assigned[i1 + offset].append(token)
+            elif tag == 'insert':
+                # Words the correction added go with the preceding word
+                assigned[max(i1 - 1, 0)].extend(tokens)
+            elif tag == 'replace':
+                self._distribute(words[i1:i2], tokens, assigned[i1:i2])
+            # 'delete': the correction dropped these words
+
+        if opcodes:
+            self.position += opcodes[-1][4]
+        return assigned
+
+    @staticmethod
+    def _distribute(words: List[str], tokens: List[str], assigned: List[List[str]]):
+        """Spread tokens over words in order, in proportion to their character counts"""
+        word_ends = []
+        total = 0
+        for word in words:
+            total += len(word)
+            word_ends.append(total)
+
+        token_total = sum(len(token) for token in tokens) or 1
+        position = 0
+        index = 0
+        for token in tokens:
+            middle = (position + len(token) / 2) / token_total * total
+            position += len(token)
+            while index < len(words) - 1 and word_ends[index] < middle:
+                index += 1
+            assigned[index].append(token)
+
+    def apply(self, lines: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Replace the words of a page's lines with the corrected ones, splitting boxes where one word became several"""
+        words = [word for line in lines for word in line['words']]
+        assigned = iter(self.align([word['text'] for word in words]))
+
+        corrected_lines = []
+        for line in lines:
+            corrected_words = []
+            for word in line['words']:
+                corrected_words.extend(self._split_word(word, next(assigned)))
+            if corrected_words:
+                corrected_lines.append(dict(line, words=corrected_words))
+        return corrected_lines
+
+    @staticmethod
+    def _split_word(word: Dict[str, Any], tokens: List[str]) -> List[Dict[str, Any]]:
+        if len(tokens) <= 1:
+            return [dict(word, text=token) for token in tokens]
+
+        left, top, right, bottom = word['box']
+        total = sum(len(token) for token in tokens)
+        rtl = _is_rtl(''.join(tokens))
+        parts = []
+        offset = 0
+        for token in tokens:
+            start = left + (right - left) * offset // total
+            offset += len(token)
+            stop = left + (right - left) * offset // total
+            if rtl:
+                start, stop = left + right - stop, left + right - start
+            parts.append(dict(word, text=token, box=(start, top, stop, bottom)))
+        return parts
+
+def iter_layouts(pages: PageResults, corrected_text: Optional[str] = None) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+    """Yield each page's layout (None for pages without word geometry), with corrected words if given"""
+    aligner = WordAligner(corrected_text) if corrected_text else None
+    for page_number, result in pages:
+        layout = result.get('layout') if result else None
+        if layout is None:
+            if result is not None:
+                logger.warning(f"Page {page_number} has no stored word geometry; exported without text")
+            yield page_number, None
+            continue
+
+        if aligner is not None:
+            layout = dict(layout, lines=aligner.apply(layout['lines']))
+        yield page_number, layout
+
+def _blocks(lines: List[Dict[str, Any]]) -> Iterator[List[Dict[str, Any]]]:
+    """Group consecutive lines of the same Tesseract block"""
+    block = []
+    for line in lines:
+        if block and line['block'] != block[-1]['block']:
+            yield block
+            block = []
+        block.append(line)
+    if block:
+        yield block
+
+def _bbox(box) -> str:
+    return f"bbox {box[0]} {box[1]} {box[2]} {box[3]}"
+
+def iter_hocr(pages: PageResults, filename: str, corrected_text: Optional[str] = None) -> Iterator[bytes]:
+    """Stream an hOCR 1.2 document, one ocr_page at a time"""
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<!DOCTYPE html PUBLIC "-//W3C//DTD XHTML 1.0 Transitional//EN" '
+        '"http://www.w3.org/TR/xhtml1/DTD/xhtml1-transitional.dtd">\n'
+        '<html xmlns="http://www.w3.org/1999/xhtml">\n'
+        ' <head>\n'
+        f'  <title>{escape(filename)}</title>\n'
+        '  <meta http-equiv="Content-Type" content="text/html;charset=utf-8"/>\n'
+        '  <meta name="ocr-system" content="OCR-Enhancer"/>\n'
+        '  <meta name="ocr-capabilities" content="ocr_page ocr_carea ocr_line ocrx_word"/>\n'
+        ' </head>\n'
+        ' <body>\n'
+    ).encode('utf-8')
+
+    for page_number, layout in iter_layouts(pages, corrected_text):
+        if layout is None:
+            continue
+
+        dpi = layout['dpi']
+        title = f'image "{filename}"; bbox 0 0 {layout["width"]} {layout["height"]}; ppageno {page_number - 1}; scan_res {dpi} {dpi}'
+        parts = [f'  <div class="ocr_page" id="page_{page_number}" title={quoteattr(title)}>\n']
+        line_number = 0
+        word_number = 0
+        for block_number, block in enumerate(_blocks(layout['lines']), 1):
+            block_box = _union([word['box'] for line in block for word in line['words']])
+            parts.append(f'   <div class="ocr_carea" id="block_{page_number}_{block_number}" title="{_bbox(block_box)}">\n')
+            for line in block:
+                line_number += 1
+                direction = ' dir="rtl"' if _is_rtl(''.join(word['text'] for word in line['words'])) else ''
+                line_box = _union([word['box'] for word in line['words']])
+                parts.append(f'    <span class="ocr_line" id="line_{page_number}_{line_number}" title="{_bbox(line_box)}"{direction}>')
+                for word in line['words']:
+                    word_number += 1
+                    parts.append(
+                        f'<span class="ocrx_word" id="word_{page_number}_{word_number}" '
+                        f'title="{_bbox(word["box"])}; x_wconf {round(word["confidence"])}">{escape(word["text"])}</span> '
+                    )
+                parts.append('</span>\n')
+            parts.append('   </div>\n')
+        parts.append('  </div>\n')
+        yield ''.join(parts).encode('utf-8')
+
+    yield ' </body>\n</html>\n'.encode('utf-8')
+
+def _alto_box(box) -> str:
+    return f'HPOS="{box[0]}" VPOS="{box[1]}" WIDTH="{box[2] - box[0]}" HEIGHT="{box[3] - box[1]}"'
+
+def iter_alto(pages: PageResults, filename: str, corrected_text: Optional[str] = None) -> Iterator[bytes]:
+    """Stream an ALTO v4 document in pixel units, one Page at a time"""
+    yield (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<alto xmlns="http://www.loc.gov/standards/alto/ns-v4#" '
+        'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" '
+        'xsi:schemaLocation="http://www.loc.gov/standards/alto/ns-v4# http://www.loc.gov/alto/v4/alto-4-2.xsd">\n'
+        '  <Description>\n'
+        '    <MeasurementUnit>pixel</MeasurementUnit>\n'
+        '    <sourceImageInformation>\n'
+        f'      <fileName>{escape(filename)}</fileName>\n'
+        '    </sourceImageInformation>\n'
+        '    <OCRProcessing ID="OCR_0">\n'
+        '      <ocrProcessingStep>\n'
+        '        <processingSoftware>\n'
+        '          <softwareName>OCR-Enhancer</softwareName>\n'
+        '        </processingSoftware>\n'
+        '      </ocrProcessingStep>\n'
+        '    </OCRProcessing>\n'
+        '  </Description>\n'
+        '  <Layout>\n'
+    ).encode('utf-8')
+
+    for page_number, layout in iter_layouts(pages, corrected_text):
+        if layout is None:
+            continue
+
+        width, height = layout['width'], layout['height']
+        parts = [
+            f'    <Page ID="page_{page_number}" PHYSICAL_IMG_NR="{page_number}" WIDTH="{width}" HEIGHT="{height}">\n',
+            f'      <PrintSpace HPOS="0" VPOS="0" WIDTH="{width}" HEIGHT="{height}">\n'
+        ]
+        line_number = 0
+        word_number = 0
+        for block_number, block in enumerate(_blocks(layout['lines']), 1):
+            block_box = _union([word['box'] for line in block for word in line['words']])
+            parts.append(f'        <TextBlock ID="block_{page_number}_{block_number}" {_alto_box(block_box)}>\n')
+            for line in block:
+                line_number += 1
+                line_box = _union([word['box'] for word in line['words']])
+                parts.append(f'          <TextLine ID="line_{page_number}_{line_number}" {_alto_box(line_box)}>\n')
+                for index, word in enumerate(line['words']):
+                    word_number += 1
+                    if index:
+                        parts.append('            <SP/>\n')
+                    parts.append(
+                        f'            <String ID="string_{page_number}_{word_number}" {_alto_box(word["box"])} '
+                        f'WC="{max(word["confidence"], 0) / 100:.2f}" CONTENT={quoteattr(word["text"])}/>\n'
+                    )
+                parts.append('          </TextLine>\n')
+            parts.append('        </TextBlock>\n')
+        parts.append('      </PrintSpace>\n    </Page>\n')
+        yield ''.join(parts).encode('utf-8')
+
+    yield '  </Layout>\n</alto>\n'.encode('utf-8')
+
+def render_page_image(file_path: str, file_extension: str, page_number: int) -> Image.Image:
+    """Image of one page of an uploaded document, for the image layer of a searchable PDF"""
+    if file_extension == 'pdf':
+        image = convert_from_path(file_path, dpi=EXPORT_PDF_DPI, first_page=page_number, last_page=page_number)[0]
+        image.info['dpi'] = (EXPORT_PDF_DPI, EXPORT_PDF_DPI)
+        return image
+    return Image.open(file_path)
+
+# Invisible text uses a font without glyphs whose character codes are UTF-16
+# code units, as in Tesseract's own PDF renderer: the text is selectable and
+# searchable in any script without embedding a font
+PDF_FONT_OBJECTS = {
+    3: b'<< /Type /Font /Subtype /Type0 /BaseFont /GlyphLessFont /Encoding /Identity-H '
+       b'/DescendantFonts [4 0 R] /ToUnicode 5 0 R >>',
+    4: b'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /GlyphLessFont '
+       b'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) /Supplement 0 >> '
+       b'/FontDescriptor 6 0 R /CIDToGIDMap /Identity /DW 500 >>',
+    6: b'<< /Type /FontDescriptor /FontName /GlyphLessFont /Flags 5 /FontBBox [0 0 500 1000] '
+       b'/ItalicAngle 0 /Ascent 1000 /Descent 0 /CapHeight 1000 /StemV 80 >>'
+}
+
+PDF_TO_UNICODE = (
+    b'/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+    b'/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) /Supplement 0 >> def\n'
+    b'/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+    b'1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+    b'1 beginbfrange\n<0000> <FFFF> <0000>\nendbfrange\n'
+    b'endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend\n'
+)
+
+class _PdfWriter:
+    """Serializes PDF objects in order while remembering their offsets for the xref table"""
+
+    def __init__(self):
+        self.offsets = {}
+        self.position = 0
+        self.next_id = max(PDF_FONT_OBJECTS) + 1
+
+    def allocate(self) -> int:
+        object_id = self.next_id
+        self.next_id += 1
+        return object_id
+
+    def write(self, data: bytes) -> bytes:
+        self.position += len(data)
+        return data
+
+    def object(self, object_id: int, body: bytes) -> bytes:
+        self.offsets[object_id] = self.position
+        return self.write(b'%d 0 obj\n' % object_id + body + b'\nendobj\n')
+
+    def stream(self, object_id: int, dictionary: bytes, data: bytes) -> bytes:
+        return self.object(object_id, b'<< ' + dictionary + b' /Length %d >>\nstream\n' % len(data) + data + b'\nendstream')
+
+    def xref(self, root_id: int) -> bytes:
+        start = self.position
+        count = self.next_id
+        entries = [b'xref\n0 %d\n' % count, b'0000000000 65535 f \n']
+        entries.extend(b'%010d 00000 n \n' % self.offsets[object_id] for object_id in range(1, count))
+        entries.append(b'trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n' % (count, root_id, start))
+        return self.write(b''.join(entries))
+
+def _pdf_text(text: str) -> Tuple[bytes, int]:
+    """Hex string of a word's UTF-16 code units and their count; astral characters become U+FFFD"""
+    text = ''.join(char if ord(char) <= 0xFFFF else '\ufffd' for char in text)
+    return b'<' + text.encode('utf-16-be').hex().upper().encode('ascii') + b'>', len(text)
+
+def _pdf_text_layer(layout: Dict[str, Any], page_height: float) -> bytes:
+    """Invisible text (render mode 3) with each word scaled to fill its box"""
+    scale = 72 / layout['dpi']
+    commands = [b'BT\n3 Tr\n']
+    for line in layout['lines']:
+        for word in line['words']:
+            text, length = _pdf_text(word['text'])
+            left, top, right, bottom = word['box']
+            size = max((bottom - top) * scale, 1)
+            width = max((right - left) * scale, 1)
+            # The glyphless font's characters are half an em wide
+            stretch = width / (length * size * 0.5) * 100 if length else 100
+            commands.append(
+                b'/F0 %.2f Tf %.2f Tz 1 0 0 1 %.2f %.2f Tm %s Tj\n'
+                % (size, stretch, left * scale, page_height - bottom * scale, text)
+            )
+    commands.append(b'ET\n')
+    return b''.join(commands)
+
+def _encode_page_image(image: Image.Image) -> Dict[str, Any]:
+    """JPEG-encode a page image for the PDF image layer"""
+    dpi = round(image.info.get('dpi', (EXPORT_PDF_DPI,))[0]) or EXPORT_PDF_DPI
+    if image.mode not in ('RGB', 'L'):
+        image = image.convert('L' if image.mode in ('1', 'LA', 'I', 'I;16') else 'RGB')
+    encoded = io.BytesIO()
+    image.save(encoded, 'JPEG', quality=EXPORT_JPEG_QUALITY)
+    return {
+        'data': encoded.getvalue(),
+        'width': image.width,
+        'height': image.height,
+        'dpi': dpi,
+        'color_space': b'/DeviceGray' if image.mode == 'L' else b'/DeviceRGB'
+    }
+
+def iter_searchable_pdf(pages: PageResults, page_image: Optional[Callable[[int], Image.Image]] = None,
+                        corrected_text: Optional[str] = None,
+                        admit: Optional[Callable[[int], ContextManager]] = None) -> Iterator[bytes]:
+    """
+    Stream a PDF with each page's image under an invisible text layer. Without
+    page_image, pages are text-only. Pages without stored geometry keep their
+    image but get no text. admit(page_number), if given, is held while a page
+    is rendered and encoded, e.g. to count it against a memory budget.
+    """
+    writer = _PdfWriter()
+    catalog_id, pages_id, to_unicode_id = 1, 2, 5
+    page_ids = []
+
+    yield writer.write(b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n')
+    for object_id, body in sorted(PDF_FONT_OBJECTS.items()):
+        yield writer.object(object_id, body)
+    yield writer.stream(to_unicode_id, b'', PDF_TO_UNICODE)
+
+    for page_number, layout in iter_layouts(pages, corrected_text):
+        encoded = None
+        if page_image is not None:
+            # Only the compressed JPEG outlives the admission of the rendered pixels
+            with admit(page_number) if admit is not None else nullcontext():
+                encoded = _encode_page_image(page_image(page_number))
+        if encoded is None and layout is None:
+            continue
+
+        if layout is not None:
+            page_width = layout['width'] * 72 / layout['dpi']
+            page_height = layout['height'] * 72 / layout['dpi']
+        else:
+            page_width = encoded['width'] * 72 / encoded['dpi']
+            page_height = encoded['height'] * 72 / encoded['dpi']
+
+        content = b''
+        resources = b'/Font << /F0 3 0 R >>'
+        if encoded is not None:
+            image_id = writer.allocate()
+            yield writer.stream(image_id, b'/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace %s '
+                                b'/BitsPerComponent 8 /Filter /DCTDecode' % (encoded['width'], encoded['height'], encoded['color_space']),
+                                encoded['data'])
+            resources += b' /XObject << /Im0 %d 0 R >>' % image_id
+            content += b'q %.2f 0 0 %.2f 0 0 cm /Im0 Do Q\n' % (page_width, page_height)
+
+        if layout is not None:
+            content += _pdf_text_layer(layout, page_height)
+
+        content_id = writer.allocate()
+        yield writer.stream(content_id, b'/Filter /FlateDecode', zlib.compress(content))
+
+        page_id = writer.allocate()
+        page_ids.append(page_id)
+        yield writer.object(page_id, b'<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %.2f %.2f] /Resources << %s >> /Contents %d 0 R >>'
+                            % (pages_id, page_width, page_height, resources, content_id))
+
+    kids = b' '.join(b'%d 0 R' % page_id for page_id in page_ids)
+    yield writer.object(pages_id, b'<< /Type /Pages /Kids [%s] /Count %d >>' % (kids, len(page_ids)))
+    yield writer.object(catalog_id, b'<< /Type /Catalog /Pages %d 0 R >>' % pages_id)
+    yield writer.xref(catalog_id)
+
+def export_document(export_format: str, pages: PageResults, filename: str, corrected_text: Optional[str] = None,
+                    page_image: Optional[Callable[[int], Image.Image]] = None,
+                    admit: Optional[Callable[[int], ContextManager]] = None) -> Iterator[bytes]:
+    """Stream stored OCR results in one of EXPORT_FORMATS"""
+    if export_format == 'hocr':
+        return iter_hocr(pages, filename, corrected_text)
+    if export_format == 'alto':
+        return iter_alto(pages, filename, corrected_text)
+    if export_format == 'pdf':
+        return iter_searchable_pdf(pages, page_image, corrected_text, admit)
+    raise ValueError(f"Unsupported export format: {export_format}")
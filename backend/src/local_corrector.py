@@ -0,0 +1,432 @@
+"""
+Local Corrector Module
+Fast in-process OCR error correction using confusion-pair tables and a
+SymSpell-style symmetric-delete dictionary index stored in a memory-mapped file
+"""
+
+import os
+import re
+import sys
+import mmap
+import zlib
+import logging
+import argparse
+from array import array
+from typing import Dict, Any, Optional, List, Tuple, Iterable
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Path to the dictionary index built with `python -m src.local_corrector build`
+LOCAL_CORRECTOR_INDEX = os.getenv('LOCAL_CORRECTOR_INDEX', '')
+
+INDEX_MAGIC = b'OCRSYM01'
+HEADER_FIELDS = 7
+HEADER_SIZE = 40
+
+# Symmetric-delete parameters used when building an index
+DEFAULT_MAX_EDIT_DISTANCE = 2
+DEFAULT_PREFIX_LENGTH = 7
+
+# Words shorter than this are left alone; too many short words are one edit apart
+MIN_WORD_LENGTH = 3
+
+# Conservative (pre-LLM) mode: words up to this length only get confusion-pair
+# fixes or corrections within this edit distance
+CONSERVATIVE_SHORT_WORD_LENGTH = 5
+CONSERVATIVE_SHORT_WORD_DISTANCE = 1
+
+# Punctuation ending a sentence; the next capitalized word may be an ordinary word
+SENTENCE_END = re.compile('[.!?؟]')
+
+# Number of looked-up words remembered between calls
+LOOKUP_CACHE_SIZE = 100000
+
+# Marks a word that is not in the lookup cache (None means "no correction")
+_CACHE_MISS = object()
+
+# Common OCR confusions as (seen, meant) pairs, tried before the edit-distance search
+CONFUSION_PAIRS = [
+    # Latin
+    ('rn', 'm'), ('m', 'rn'), ('cl', 'd'), ('d', 'cl'), ('vv', 'w'),
+    ('li', 'h'), ('0', 'o'), ('1', 'l'), ('1', 'i'), ('5', 's'), ('8', 'b'),
+    # Arabic: taa marbuta/haa, alef maqsura/yaa and hamza forms
+    ('ه', 'ة'), ('ة', 'ه'), ('ى', 'ي'), ('ي', 'ى'),
+    ('ا', 'أ'), ('ا', 'إ'), ('ا', 'آ'), ('أ', 'ا'), ('إ', 'ا'),
+    ('و', 'ؤ'), ('ى', 'ئ')
+]
+
+# Arabic diacritics and tatweel are ignored when looking words up
+ARABIC_MARKS = re.compile('[\u064B-\u0652\u0640]')
+
+WORD_PATTERN = re.compile(r'^(\W*)(.*?)(\W*)$', re.DOTALL)
+
+def _hash(text: str) -> int:
+    """Stable 32-bit hash of a string, shared by the index builder and the lookup"""
+    return zlib.crc32(text.encode('utf-8'))
+
+def _delete_levels(word: str, max_distance: int, prefix_length: int) -> List[set]:
+    """Strings reachable from the word prefix by deleting 0, 1, ... max_distance characters"""
+    prefix = word[:prefix_length]
+    levels = [{prefix}]
+    seen = {prefix}
+    for _ in range(max_distance):
+        next_level = set()
+        for item in levels[-1]:
+            if len(item) <= 1:
+                continue
+            for i in range(len(item)):
+                deleted = item[:i] + item[i + 1:]
+                if deleted not in seen:
+                    next_level.add(deleted)
+        seen |= next_level
+        levels.append(next_level)
+    return levels
+
+def _deletes(word: str, max_distance: int, prefix_length: int) -> set:
+    """All strings reachable from the word prefix by deleting up to max_distance characters"""
+    deletes = set().union(*_delete_levels(word, max_distance, prefix_length))
+    # Words longer than the prefix are also indexed whole, for exact lookups
+    deletes.add(word)
+    return deletes
+
+def _edit_distance(a: str, b: str, max_distance: int) -> int:
+    """Optimal string alignment distance, or max_distance + 1 when it is larger"""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous_previous = None
+    previous = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        row_min = current[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if (previous_previous is not None and i > 1 and j > 1 and
+                    a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+            row_min = min(row_min, current[j])
+        if row_min > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+
+    return previous[-1] if previous[-1] <= max_distance else max_distance + 1
+
+def _match_case(original: str, corrected: str) -> str:
+    """Carry the capitalization of the OCR word over to its correction"""
+    if original.isupper() and len(original) > 1:
+        return corrected.upper()
+    if original[:1].isupper():
+        return corrected[:1].upper() + corrected[1:]
+    return corrected
+
+def build_index(words: Iterable[Tuple[str, int]], output_path: str,
+                max_distance: int = DEFAULT_MAX_EDIT_DISTANCE,
+                prefix_length: int = DEFAULT_PREFIX_LENGTH) -> Dict[str, int]:
+    """
+    Write a symmetric-delete index for (word, frequency) pairs.
+
+    Layout, all native uint32 arrays after a fixed header:
+    word offsets, word frequencies, bucket offsets, entry hashes, entry word ids,
+    then the UTF-8 word blob. Entries are grouped by bucket (hash % bucket count)
+    so a lookup reads one small contiguous range.
+    """
+    frequencies = {}
+    for word, frequency in words:
+        word = ARABIC_MARKS.sub('', word.strip().lower())
+        if word:
+            frequencies[word] = frequencies.get(word, 0) + max(int(frequency), 1)
+
+    word_list = sorted(frequencies)
+    entries = []
+    for word_id, word in enumerate(word_list):
+        for deleted in _deletes(word, max_distance, prefix_length):
+            entries.append((_hash(deleted), word_id))
+
+    bucket_count = max(1, len(entries) // 4)
+    entries.sort(key=lambda entry: entry[0] % bucket_count)
+
+    bucket_offsets = array('I', [0] * (bucket_count + 1))
+    for entry_hash, _ in entries:
+        bucket_offsets[entry_hash % bucket_count + 1] += 1
+    for i in range(bucket_count):
+        bucket_offsets[i + 1] += bucket_offsets[i]
+
+    word_offsets = array('I', [0])
+    blob = bytearray()
+    for word in word_list:
+        blob += word.encode('utf-8')
+        word_offsets.append(len(blob))
+
+    header = array('I', [max_distance, prefix_length, len(word_list), len(entries), bucket_count, len(blob), 0])
+    with open(output_path, 'wb') as f:
+        f.write(INDEX_MAGIC)
+        f.write(header.tobytes())
+        f.write(b'\0' * (HEADER_SIZE - len(INDEX_MAGIC) - header.itemsize * HEADER_FIELDS))
+        f.write(word_offsets.tobytes())
+        f.write(array('I', (frequencies[word] for word in word_list)).tobytes())
+        f.write(bucket_offsets.tobytes())
+        f.write(array('I', (entry[0] for entry in entries)).tobytes())
+        f.write(array('I', (entry[1] for entry in entries)).tobytes())
+        f.write(bytes(blob))
+
+    return {'words': len(word_list), 'entries': len(entries), 'buckets': bucket_count}
+
+class DictionaryIndex:
+    """Read-only view of a symmetric-delete index file through mmap"""
+
+    def __init__(self, path: str):
+        self._file = open(path, 'rb')
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+
+        if bytes(view[:len(INDEX_MAGIC)]) != INDEX_MAGIC:
+            raise ValueError(f"{path} is not a local corrector index")
+
+        header = view[len(INDEX_MAGIC):len(INDEX_MAGIC) + 4 * HEADER_FIELDS].cast('I')
+        (self.max_distance, self.prefix_length, self.word_count,
+         entry_count, self.bucket_count, blob_size, _) = header.tolist()
+
+        offset = HEADER_SIZE
+
+        def take(count):
+            nonlocal offset
+            section = view[offset:offset + 4 * count].cast('I')
+            offset += 4 * count
+            return section
+
+        self._word_offsets = take(self.word_count + 1)
+        self._word_frequencies = take(self.word_count)
+        self._bucket_offsets = take(self.bucket_count + 1)
+        self._entry_hashes = take(entry_count)
+        self._entry_words = take(entry_count)
+        self._blob = view[offset:offset + blob_size]
+
+    def word(self, word_id: int) -> str:
+        return bytes(self._blob[self._word_offsets[word_id]:self._word_offsets[word_id + 1]]).decode('utf-8')
+
+    def frequency(self, word_id: int) -> int:
+        return self._word_frequencies[word_id]
+
+    def candidates(self, text: str) -> List[int]:
+        """Word ids whose delete set contains the given string"""
+        text_hash = _hash(text)
+        bucket = text_hash % self.bucket_count
+        start, end = self._bucket_offsets[bucket], self._bucket_offsets[bucket + 1]
+        return [self._entry_words[i] for i in range(start, end) if self._entry_hashes[i] == text_hash]
+
+    def lookup(self, word: str) -> Optional[int]:
+        """Word id of an exact dictionary match, or None"""
+        for word_id in self.candidates(word):
+            if self.word(word_id) == word:
+                return word_id
+        return None
+
+class LocalCorrector:
+    """Rule-based OCR corrector that runs entirely in-process"""
+
+    def __init__(self, index_path: str = LOCAL_CORRECTOR_INDEX):
+        self.index = None
+        self._cache = {}
+        self._initialize_index(index_path)
+
+    def _initialize_index(self, index_path: str):
+        """Open the dictionary index"""
+        if not index_path:
+            logger.warning("Local corrector index not configured. Local correction will not be available.")
+            return
+
+        try:
+            self.index = DictionaryIndex(index_path)
+            logger.info(f"Local corrector index loaded ({self.index.word_count} words)")
+        except Exception as e:
+            logger.error(f"Failed to load local corrector index: {e}")
+
+    def is_available(self) -> bool:
+        """Check if local correction is available"""
+        return self.index is not None
+
+    def _confusion_variants(self, word: str) -> set:
+        """Words obtained by undoing one confusion, or every occurrence of it"""
+        variants = set()
+        for seen, meant in CONFUSION_PAIRS:
+            start = word.find(seen)
+            if start < 0:
+                continue
+            variants.add(word.replace(seen, meant))
+            while start >= 0:
+                variants.add(word[:start] + meant + word[start + len(seen):])
+                start = word.find(seen, start + 1)
+        variants.discard(word)
+        return variants
+
+    def _best_candidate(self, word: str, max_distance: Optional[int] = None) -> Optional[str]:
+        """Find the correction for a lowercase word, or None if it should stay"""
+        index = self.index
+        max_distance = index.max_distance if max_distance is None else min(max_distance, index.max_distance)
+        if index.lookup(word) is not None:
+            return None
+
+        # Known OCR confusions win over generic edits
+        best = None
+        for variant in self._confusion_variants(word):
+            word_id = index.lookup(variant)
+            if word_id is not None and (best is None or index.frequency(word_id) > best[1]):
+                best = (variant, index.frequency(word_id))
+        if best:
+            return best[0]
+
+        # Symmetric-delete search: the input's deletes meet the dictionary's deletes
+        best = None
+        best_key = (max_distance + 1, 0)
+        seen_ids = set()
+        for level, deletes in enumerate(_delete_levels(word, max_distance, index.prefix_length)):
+            # Deeper deletes cannot produce a closer match than one already found
+            if level > best_key[0]:
+                break
+            for deleted in deletes:
+                for word_id in index.candidates(deleted):
+                    if word_id in seen_ids:
+                        continue
+                    seen_ids.add(word_id)
+                    candidate = index.word(word_id)
+                    if abs(len(candidate) - len(word)) > best_key[0]:
+                        continue
+                    distance = _edit_distance(word, candidate, best_key[0])
+                    key = (distance, -index.frequency(word_id))
+                    if distance <= max_distance and key < best_key:
+                        best, best_key = candidate, key
+
+        return best
+
+    def correct_word(self, word: str, conservative: bool = False) -> Optional[str]:
+        """
+        Return the corrected form of a single word, or None if it should stay.
+        Conservative mode limits short words to confusion pairs or one edit.
+        """
+        lookup_word = ARABIC_MARKS.sub('', word.lower())
+        if len(lookup_word) < MIN_WORD_LENGTH or lookup_word.isdigit():
+            return None
+
+        max_distance = None
+        if conservative and len(lookup_word) <= CONSERVATIVE_SHORT_WORD_LENGTH:
+            max_distance = CONSERVATIVE_SHORT_WORD_DISTANCE
+
+        # The cache is shared by request threads and may be cleared by another
+        # thread at any time, so read it once and recompute on a miss
+        cache_key = (lookup_word, max_distance)
+        corrected = self._cache.get(cache_key, _CACHE_MISS)
+        if corrected is _CACHE_MISS:
+            corrected = self._best_candidate(lookup_word, max_distance)
+            if len(self._cache) >= LOOKUP_CACHE_SIZE:
+                self._cache.clear()
+            self._cache[cache_key] = corrected
+
+        return _match_case(word, corrected) if corrected else None
+
+    def correct_text(self, text: str, language: str = 'mixed', context: str = None, conservative: bool = False) -> Dict[str, Any]:
+        """
+        Correct OCR text locally, returning the same shape as AICorrector.correct_text.
+        Conservative mode, used ahead of the LLM, leaves capitalized and
+        mixed-case words inside a sentence (names, acronyms) to the LLM and
+        only makes small fixes to short words.
+        """
+        if not self.is_available():
+            return {
+                'original_text': text,
+                'corrected_text': text,
+                'confidence': 0,
+                'changes_made': [],
+                'success': False,
+                'error': 'Local correction not available - dictionary index not configured'
+            }
+
+        try:
+            changes = []
+            parts = re.split(r'(\s+)', text)
+            position = 0
+            sentence_start = True
+            for i, part in enumerate(parts):
+                if not part:
+                    continue
+                if part.isspace():
+                    # A blank line starts a new paragraph, e.g. after a heading
+                    sentence_start = sentence_start or part.count('\n') > 1
+                    continue
+
+                # Keep surrounding punctuation, correct only the word itself
+                leading, word, trailing = WORD_PATTERN.match(part).groups()
+                skip = conservative and word != word.lower() and not (sentence_start and word[1:] == word[1:].lower())
+                sentence_start = bool(SENTENCE_END.search(trailing))
+                corrected = self.correct_word(word, conservative) if word and not skip else None
+                if corrected and corrected != word:
+                    parts[i] = leading + corrected + trailing
+                    changes.append({
+                        'type': 'word_change',
+                        'original': part,
+                        'corrected': parts[i],
+                        'position': position
+                    })
+                position += 1
+
+            word_count = max(position, 1)
+            return {
+                'original_text': text,
+                'corrected_text': ''.join(parts),
+                'confidence': max(50.0, 100.0 - 100.0 * len(changes) / word_count),
+                'changes_made': changes,
+                'success': True,
+                'error': None,
+                'model_used': 'local'
+            }
+
+        except Exception as e:
+            logger.error(f"Error in local correction: {e}")
+            return {
+                'original_text': text,
+                'corrected_text': text,
+                'confidence': 0,
+                'changes_made': [],
+                'success': False,
+                'error': str(e)
+            }
+
+def _read_word_list(path: str) -> Iterable[Tuple[str, int]]:
+    """Read 'word' or 'word frequency' lines from a word list"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            frequency = int(fields[1]) if len(fields) > 1 and fields[1].isdigit() else 1
+            yield fields[0], frequency
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description='Local OCR corrector tools')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='Build a dictionary index from word lists')
+    build.add_argument('word_lists', nargs='+', help="Files with one 'word [frequency]' per line (English, Arabic, ...)")
+    build.add_argument('-o', '--output', required=True, help='Index file to write')
+    build.add_argument('--max-distance', type=int, default=DEFAULT_MAX_EDIT_DISTANCE)
+    build.add_argument('--prefix-length', type=int, default=DEFAULT_PREFIX_LENGTH)
+
+    correct = subparsers.add_parser('correct', help='Correct a text file with an index')
+    correct.add_argument('index', help='Index file')
+    correct.add_argument('text_file', help='Text file to correct')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        words = (pair for path in args.word_lists for pair in _read_word_list(path))
+        stats = build_index(words, args.output, args.max_distance, args.prefix_length)
+        print(f"Wrote {args.output}: {stats['words']} words, {stats['entries']} delete entries")
+    else:
+        with open(args.text_file, 'r', encoding='utf-8') as f:
+            result = LocalCorrector(args.index).correct_text(f.read())
+        sys.stdout.write(result['corrected_text'])
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+from datetime import datetime
+from src.models.user import db
+
+class OCRDocument(db.Model):
+    file_id = db.Column(db.String(36), primary_key=True)
+    filename = db.Column(db.String(255), nullable=False)
+    file_extension = db.Column(db.String(10), nullable=False)
+    file_path = db.Column(db.String(500), nullable=True)
+    page_count = db.Column(db.Integer, nullable=True)
+    settings = db.Column(db.JSON, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.now)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<OCRDocument {self.file_id}>'
+
+    def to_dict(self):
+        return {
+            'file_id': self.file_id,
+            'filename': self.filename,
+            'file_extension': self.file_extension,
+            'page_count': self.page_count,
+            'settings': self.settings,
+            'created_at': self.created_at.isoformat(),
+            'expires_at': self.expires_at.isoformat()
+        }
+
+class OCRPageResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    file_id = db.Column(db.String(36), db.ForeignKey('ocr_document.file_id'), nullable=False, index=True)
+    engine = db.Column(db.String(50), nullable=False)
+    language = db.Column(db.String(50), nullable=False)
+    page_number = db.Column(db.Integer, nullable=True)
+    result = db.Column(db.JSON, nullable=False)
+
+    def __repr__(self):
+        return f'<OCRPageResult {self.file_id} {self.engine} {self.language} {self.page_number}>'
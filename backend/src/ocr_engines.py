@@ -4,29 +4,136 @@ Handles different OCR processing methods including Tesseract and external OCR re
 """
 
 import os
+import io
 import tempfile
-from typing import List, Dict, Any, Optional
+import subprocess
+from contextlib import nullcontext
+from typing import List, Dict, Any, Optional, Callable, Tuple
 from PIL import Image
 import pytesseract
-from pdf2image import convert_from_path
+from pdf2image import convert_from_path, pdfinfo_from_path
+from dotenv import load_dotenv
 import logging
+from src.admission import AdmissionRejected
+
+# Load environment variables
+load_dotenv()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Resolution PDF pages are rendered at before OCR
+PDF_DPI = 300
+
+# PDF pages rendered (and admitted against the memory budget) at once
+PDF_BATCH_PAGES = int(os.getenv('PDF_BATCH_PAGES', 4))
+
+# Progressive mode: fast draft resolution and the word confidence below which
+# a word counts as weak. A line is re-rendered at PDF_DPI and OCR'd again when
+# its mean confidence is below the threshold or at least REFINE_WEAK_WORD_SHARE
+# of its words are weak; a single weak word in a long line is not enough
+PROGRESSIVE_DRAFT_DPI = int(os.getenv('PROGRESSIVE_DRAFT_DPI', 150))
+PROGRESSIVE_CONFIDENCE_THRESHOLD = float(os.getenv('PROGRESSIVE_CONFIDENCE_THRESHOLD', 60))
+REFINE_WEAK_WORD_SHARE = float(os.getenv('REFINE_WEAK_WORD_SHARE', 0.2))
+
+# Pixels (at PDF_DPI) added around a line before it is cropped for refinement
+REFINE_LINE_PADDING = 10
+
+# Blank pixels between line crops stacked for a single refinement pass
+REFINE_STACK_GAP = 30
+
+# Rendered pixels are copied a few times on their way through PIL and Tesseract
+PIXEL_MEMORY_OVERHEAD = 2.5
+
+# Language used when the caller asks for automatic script detection
+AUTO_LANGUAGE = 'auto'
+
+# Tesseract models to fall back on when a page's script cannot be determined
+DEFAULT_LANGUAGES = 'eng+ara'
+
+# Longest side (in pixels) of the image used for the script detection probe
+SCRIPT_PROBE_MAX_SIZE = 1000
+
+# Longest side (in pixels) of the image OCR'd to verify a near-duplicate page
+# match; large enough to read body text, so pages differing in one field differ
+DEDUP_PROBE_MAX_SIZE = 1600
+
+# Minimum share of letters a script needs before a page is treated as mixed
+MIXED_SCRIPT_RATIO = 0.1
+
+# Mapping between detected scripts and Tesseract language codes
+SCRIPT_LANGUAGES = {
+    'Latin': 'eng',
+    'Arabic': 'ara',
+    'Mixed': 'eng+ara'
+}
+
+def _is_arabic_char(char: str) -> bool:
+    """Check if a character belongs to one of the Arabic Unicode blocks"""
+    code = ord(char)
+    return (0x0600 <= code <= 0x06FF or 0x0750 <= code <= 0x077F or
+            0x08A0 <= code <= 0x08FF or 0xFB50 <= code <= 0xFDFF or
+            0xFE70 <= code <= 0xFEFF)
+
+def classify_script(text: str) -> Dict[str, Any]:
+    """Classify the script of a text sample by counting Arabic and Latin letters"""
+    arabic_count = 0
+    latin_count = 0
+    
+    for char in text:
+        if _is_arabic_char(char):
+            arabic_count += 1
+        elif char.isascii() and char.isalpha():
+            latin_count += 1
+    
+    total = arabic_count + latin_count
+    if total == 0:
+        script = 'Unknown'
+    elif min(arabic_count, latin_count) / total >= MIXED_SCRIPT_RATIO:
+        script = 'Mixed'
+    elif arabic_count > latin_count:
+        script = 'Arabic'
+    else:
+        script = 'Latin'
+    
+    return {
+        'script': script,
+        'arabic_ratio': arabic_count / total if total else 0,
+        'latin_ratio': latin_count / total if total else 0
+    }
+
+def script_to_correction_language(scripts: List[str]) -> str:
+    """Map detected scripts to the language hint used by the AI corrector"""
+    known = {script for script in scripts if script in SCRIPT_LANGUAGES}
+    if known == {'Arabic'}:
+        return 'ara'
+    if known == {'Latin'}:
+        return 'eng'
+    return 'mixed'
+
+class _ImmediateResult:
+    """Future-like wrapper for work run inline when no scheduler is used"""
+    
+    def __init__(self, value: Any):
+        self._value = value
+    
+    def result(self) -> Any:
+        return self._value
+
 class OCREngine:
     """Base class for OCR engines"""
     
     def __init__(self, name: str):
         self.name = name
     
-    def extract_text(self, image_path: str, language: str = 'eng+ara') -> Dict[str, Any]:
+    def extract_text(self, image_path: str, language: str = 'eng+ara', dedup: Optional[Any] = None) -> Dict[str, Any]:
         """Extract text from image"""
         raise NotImplementedError
     
-    def process_pdf(self, pdf_path: str, language: str = 'eng+ara') -> List[Dict[str, Any]]:
-        """Process PDF file and extract text from all pages"""
+    def process_pdf(self, pdf_path: str, language: str = 'eng+ara', pages: Optional[List[int]] = None, submit: Optional[Callable] = None, dedup: Optional[Any] = None,
+                    admit: Optional[Callable] = None) -> List[Dict[str, Any]]:
+        """Process PDF file and extract text from all pages, or only the given page numbers"""
         raise NotImplementedError
 
 class TesseractEngine(OCREngine):
@@ -42,12 +149,51 @@ class TesseractEngine(OCREngine):
             logger.error(f"Tesseract OCR is not available: {e}")
             raise
     
-    def extract_text(self, image_path: str, language: str = 'eng+ara') -> Dict[str, Any]:
-        """Extract text from image using Tesseract"""
+    def detect_script(self, image: Image.Image) -> Dict[str, Any]:
+        """Detect the script(s) on a page with a cheap low-resolution OCR probe"""
+        try:
+            probe = image.copy()
+            probe.thumbnail((SCRIPT_PROBE_MAX_SIZE, SCRIPT_PROBE_MAX_SIZE))
+            
+            # Sparse text mode is enough: only the mix of characters matters
+            # here, not the recognition quality
+            sample = pytesseract.image_to_string(probe, lang=DEFAULT_LANGUAGES, config='--oem 1 --psm 11')
+            detection = classify_script(sample)
+        except Exception as e:
+            logger.warning(f"Script detection failed, using default languages: {e}")
+            detection = {'script': 'Unknown', 'arabic_ratio': 0, 'latin_ratio': 0}
+        
+        detection['language'] = SCRIPT_LANGUAGES.get(detection['script'], DEFAULT_LANGUAGES)
+        return detection
+    
+    def probe_text(self, image: Image.Image, language: str = 'eng+ara') -> str:
+        """Cheap low-resolution OCR of a page, used to verify near-duplicate page matches"""
+        probe = image.copy()
+        probe.thumbnail((DEDUP_PROBE_MAX_SIZE, DEDUP_PROBE_MAX_SIZE))
+        if language == AUTO_LANGUAGE:
+            language = DEFAULT_LANGUAGES
+        return pytesseract.image_to_string(probe, lang=language, config='--oem 1 --psm 6')
+    
+    def extract_text(self, image_path: str, language: str = 'eng+ara', dedup: Optional[Any] = None) -> Dict[str, Any]:
+        """Extract text from image using Tesseract, reusing near-duplicate pages when a PageDeduplicator is given"""
+        detected_script = None
+        requested_language = language
         try:
             # Open image
             image = Image.open(image_path)
             
+            if dedup is not None:
+                cached, fingerprint = dedup.lookup(image, self.name, requested_language,
+                                                   lambda page: self.probe_text(page, requested_language))
+                if cached is not None:
+                    return cached
+            
+            # Run only the models for the scripts actually present on the page
+            if language == AUTO_LANGUAGE:
+                detection = self.detect_script(image)
+                language = detection['language']
+                detected_script = detection['script']
+            
             # Configure Tesseract
             config = '--oem 3 --psm 6'  # Use LSTM OCR Engine Mode with uniform text block
             
@@ -61,16 +207,23 @@ class TesseractEngine(OCREngine):
             confidences = [int(conf) for conf in data['conf'] if int(conf) > 0]
             avg_confidence = sum(confidences) / len(confidences) if confidences else 0
             
-            return {
+            result = {
                 'engine': self.name,
                 'text': text.strip(),
                 'confidence': avg_confidence,
                 'word_count': len(text.split()),
                 'language': language,
+                'detected_script': detected_script,
                 'success': True,
-                'error': None
+                'error': None,
+                'layout': self._layout(self._lines_from_data(data), image)
             }
             
+            if dedup is not None:
+                dedup.store(fingerprint, self.name, requested_language, result)
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Error in Tesseract OCR: {e}")
             return {
@@ -79,33 +232,65 @@ class TesseractEngine(OCREngine):
                 'confidence': 0,
                 'word_count': 0,
                 'language': language,
+                'detected_script': detected_script,
                 'success': False,
                 'error': str(e)
             }
     
-    def process_pdf(self, pdf_path: str, language: str = 'eng+ara') -> List[Dict[str, Any]]:
-        """Process PDF file and extract text from all pages"""
+    def ocr_page(self, image: Image.Image, page_num: int, language: str = 'eng+ara', dedup: Optional[Any] = None) -> Dict[str, Any]:
+        """Extract text from a single rendered PDF page"""
+        # Near-duplicate pages skip the PNG round-trip and OCR entirely
+        if dedup is not None:
+            cached, fingerprint = dedup.lookup(image, self.name, language, lambda page: self.probe_text(page, language))
+            if cached is not None:
+                cached['page_number'] = page_num
+                return cached
+        
+        # Save image to temporary file
+        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
+            image.save(temp_file.name, 'PNG', dpi=(PDF_DPI, PDF_DPI))
+            
+            # Extract text from image
+            result = self.extract_text(temp_file.name, language)
+            result['page_number'] = page_num
+            
+            # Clean up temporary file
+            os.unlink(temp_file.name)
+        
+        if dedup is not None:
+            dedup.store(fingerprint, self.name, language, result, page_num)
+        
+        return result
+    
+    def process_pdf(self, pdf_path: str, language: str = 'eng+ara', pages: Optional[List[int]] = None, submit: Optional[Callable] = None, dedup: Optional[Any] = None,
+                    admit: Optional[Callable] = None) -> List[Dict[str, Any]]:
+        """
+        Process PDF file and extract text from all pages, or only the given page numbers.
+        When a submit callable is given, each page is handed to it as a separate task.
+        Pages are rendered PDF_BATCH_PAGES at a time, each batch held under
+        admit(page_numbers, dpi) when given so only rendered pages count against the budget.
+        """
         results = []
+        admit = admit or (lambda batch, dpi: nullcontext())
         
         try:
-            # Convert PDF to images
-            images = convert_from_path(pdf_path, dpi=300)
-            
-            for page_num, image in enumerate(images, 1):
-                # Save image to temporary file
-                with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as temp_file:
-                    image.save(temp_file.name, 'PNG')
-                    
-                    # Extract text from image
-                    result = self.extract_text(temp_file.name, language)
-                    result['page_number'] = page_num
-                    results.append(result)
+            for batch in self._page_batches(pdf_path, pages):
+                with admit(batch, PDF_DPI):
+                    numbered_images = self._render_batch(pdf_path, batch, PDF_DPI)
                     
-                    # Clean up temporary file
-                    os.unlink(temp_file.name)
+                    if submit is None:
+                        for page_num, image in numbered_images:
+                            results.append(self.ocr_page(image, page_num, language, dedup))
+                    else:
+                        futures = [submit(self.ocr_page, image, page_num, language, dedup) for page_num, image in numbered_images]
+                        results.extend(future.result() for future in futures)
+                    # Free this batch's pixels before the next one is admitted and rendered
+                    del numbered_images
             
             return results
             
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Error processing PDF: {e}")
             return [{
@@ -116,7 +301,271 @@ class TesseractEngine(OCREngine):
                 'language': language,
                 'success': False,
                 'error': str(e),
-                'page_number': 1
+                'page_number': pages[0] if pages else 1
+            }]
+    
+    @staticmethod
+    def _page_batches(pdf_path: str, pages: Optional[List[int]] = None) -> List[List[int]]:
+        """Split the requested page numbers (default: every page) into render batches"""
+        if pages is None:
+            pages = list(range(1, pdfinfo_from_path(pdf_path)['Pages'] + 1))
+        return [pages[start:start + PDF_BATCH_PAGES] for start in range(0, len(pages), PDF_BATCH_PAGES)]
+    
+    @staticmethod
+    def _render_batch(pdf_path: str, batch: List[int], dpi: int) -> List[tuple]:
+        """Render a batch of pages as (page_num, image) pairs, in one pdftoppm run when they are consecutive"""
+        if batch == list(range(batch[0], batch[-1] + 1)):
+            return list(zip(batch, convert_from_path(pdf_path, dpi=dpi, first_page=batch[0], last_page=batch[-1])))
+        return [
+            (page_num, convert_from_path(pdf_path, dpi=dpi, first_page=page_num, last_page=page_num)[0])
+            for page_num in batch
+        ]
+
+    @staticmethod
+    def _lines_from_data(data: Dict[str, List[Any]]) -> List[Dict[str, Any]]:
+        """Group Tesseract image_to_data words into lines with their boxes and confidences"""
+        lines = []
+        by_key = {}
+        for i, word in enumerate(data['text']):
+            confidence = float(data['conf'][i])
+            if confidence < 0 or not word.strip():
+                continue
+            key = (data['block_num'][i], data['par_num'][i], data['line_num'][i])
+            if key not in by_key:
+                by_key[key] = {'block': key[0], 'words': []}
+                lines.append(by_key[key])
+            by_key[key]['words'].append({
+                'text': word,
+                'confidence': confidence,
+                'box': (data['left'][i], data['top'][i], data['left'][i] + data['width'][i], data['top'][i] + data['height'][i])
+            })
+        return lines
+    
+    @staticmethod
+    def _layout(lines: List[Dict[str, Any]], image: Image.Image, dpi: Optional[int] = None) -> Dict[str, Any]:
+        """Word geometry of a page, kept with the result so exports never need to re-run OCR"""
+        if dpi is None:
+            dpi = round(image.info.get('dpi', (PDF_DPI,))[0]) or PDF_DPI
+        return {
+            'width': image.width,
+            'height': image.height,
+            'dpi': dpi,
+            'lines': lines
+        }
+    
+    @staticmethod
+    def _text_from_lines(lines: List[Dict[str, Any]]) -> str:
+        """Rebuild page text from lines, with a blank line between blocks"""
+        parts = []
+        previous_block = None
+        for line in lines:
+            if previous_block is not None and line['block'] != previous_block:
+                parts.append('')
+            parts.append(' '.join(word['text'] for word in line['words']))
+            previous_block = line['block']
+        return '\n'.join(parts).strip()
+    
+    @staticmethod
+    def _average_confidence(lines: List[Dict[str, Any]]) -> float:
+        confidences = [word['confidence'] for line in lines for word in line['words'] if word['confidence'] > 0]
+        return sum(confidences) / len(confidences) if confidences else 0
+    
+    def draft_page(self, image: Image.Image, page_num: int, language: str = 'eng+ara', dpi: int = PROGRESSIVE_DRAFT_DPI) -> Dict[str, Any]:
+        """First progressive pass: OCR a low-resolution page and keep its line layout for refinement"""
+        detected_script = None
+        try:
+            if language == AUTO_LANGUAGE:
+                detection = self.detect_script(image)
+                language = detection['language']
+                detected_script = detection['script']
+            
+            data = pytesseract.image_to_data(image, lang=language, config='--oem 3 --psm 6', output_type=pytesseract.Output.DICT)
+            lines = self._lines_from_data(data)
+            text = self._text_from_lines(lines)
+            confidence = self._average_confidence(lines)
+            
+            return {
+                'engine': self.name,
+                'text': text,
+                'confidence': confidence,
+                'word_count': len(text.split()),
+                'language': language,
+                'detected_script': detected_script,
+                'success': True,
+                'error': None,
+                'page_number': page_num,
+                'draft_text': text,
+                'draft_confidence': confidence,
+                'layout': self._layout(lines, image, dpi)
+            }
+        
+        except Exception as e:
+            logger.error(f"Error in Tesseract draft OCR: {e}")
+            return {
+                'engine': self.name,
+                'text': '',
+                'confidence': 0,
+                'word_count': 0,
+                'language': language,
+                'detected_script': detected_script,
+                'success': False,
+                'error': str(e),
+                'page_number': page_num
+            }
+    
+    @staticmethod
+    def _is_weak_line(line: Dict[str, Any], threshold: float) -> bool:
+        """Whether a draft line is worth refining: low mean confidence or a large share of weak words"""
+        confidences = [word['confidence'] for word in line['words']]
+        weak_words = sum(1 for confidence in confidences if confidence < threshold)
+        return sum(confidences) / len(confidences) < threshold or weak_words / len(confidences) >= REFINE_WEAK_WORD_SHARE
+    
+    def refine_page(self, pdf_path: str, draft: Dict[str, Any], threshold: float = PROGRESSIVE_CONFIDENCE_THRESHOLD, draft_dpi: int = PROGRESSIVE_DRAFT_DPI) -> Dict[str, Any]:
+        """Second progressive pass: re-OCR only the low-confidence lines of a draft at full resolution"""
+        result = dict(draft)
+        result['refined_lines'] = 0
+        if not result.get('success') or not result.get('layout', {}).get('lines'):
+            return result
+        
+        # Refined lines replace words in place, so work on a copy of the draft's lines
+        lines = [dict(line) for line in result['layout']['lines']]
+        result['layout'] = dict(result['layout'], lines=lines)
+        
+        low_lines = [line for line in lines if self._is_weak_line(line, threshold)]
+        result['low_confidence_lines'] = len(low_lines)
+        if not low_lines:
+            return result
+        
+        try:
+            scale = PDF_DPI / draft_dpi
+            page_width = result['layout']['width'] * scale
+            page_height = result['layout']['height'] * scale
+            
+            # Full-resolution boxes of the weak lines, padded and kept on the page
+            line_boxes = []
+            for line in low_lines:
+                line_boxes.append((
+                    max(int(min(word['box'][0] for word in line['words']) * scale - REFINE_LINE_PADDING), 0),
+                    max(int(min(word['box'][1] for word in line['words']) * scale - REFINE_LINE_PADDING), 0),
+                    min(int(max(word['box'][2] for word in line['words']) * scale + REFINE_LINE_PADDING), int(page_width)),
+                    min(int(max(word['box'][3] for word in line['words']) * scale + REFINE_LINE_PADDING), int(page_height))
+                ))
+            
+            # Render only the region spanned by the weak lines, not the whole page
+            region = (
+                min(box[0] for box in line_boxes), min(box[1] for box in line_boxes),
+                max(box[2] for box in line_boxes), max(box[3] for box in line_boxes)
+            )
+            image = self._render_region(pdf_path, result['page_number'], region)
+            
+            # Stack the line crops into one image so a single Tesseract run
+            # (one process, one model load) refines every weak line of the page
+            offsets = []
+            stack_height = 0
+            for box in line_boxes:
+                offsets.append(stack_height)
+                stack_height += box[3] - box[1] + REFINE_STACK_GAP
+            stack = Image.new(image.mode, (max(box[2] - box[0] for box in line_boxes), stack_height), 'white')
+            for box, offset in zip(line_boxes, offsets):
+                stack.paste(image.crop((box[0] - region[0], box[1] - region[1], box[2] - region[0], box[3] - region[1])), (0, offset))
+            
+            data = pytesseract.image_to_data(stack, lang=result['language'], config='--oem 3 --psm 4', output_type=pytesseract.Output.DICT)
+            
+            # Assign each recognized word to the line crop it was found in and
+            # map its box back onto the draft page
+            refined_by_line = [[] for _ in low_lines]
+            for word in (word for refined in self._lines_from_data(data) for word in refined['words']):
+                x0, y0, x1, y1 = word['box']
+                middle = (y0 + y1) / 2
+                index = max(i for i, offset in enumerate(offsets) if offset <= middle)
+                box = line_boxes[index]
+                word['box'] = (
+                    round((x0 + box[0]) / scale), round((y0 - offsets[index] + box[1]) / scale),
+                    round((x1 + box[0]) / scale), round((y1 - offsets[index] + box[1]) / scale)
+                )
+                refined_by_line[index].append(word)
+            
+            for line, refined_words in zip(low_lines, refined_by_line):
+                if not refined_words:
+                    continue
+                draft_confidence = sum(word['confidence'] for word in line['words']) / len(line['words'])
+                refined_confidence = sum(word['confidence'] for word in refined_words) / len(refined_words)
+                if refined_confidence > draft_confidence:
+                    line['words'] = refined_words
+                    result['refined_lines'] += 1
+            
+            text = self._text_from_lines(lines)
+            result['text'] = text
+            result['confidence'] = self._average_confidence(lines)
+            result['word_count'] = len(text.split())
+        
+        except Exception as e:
+            # The draft is still a usable result
+            logger.error(f"Error refining page {result.get('page_number')}: {e}")
+            result['refine_error'] = str(e)
+        
+        return result
+    
+    @staticmethod
+    def _render_region(pdf_path: str, page_num: int, box: tuple) -> Image.Image:
+        """Render one rectangle (in PDF_DPI pixels) of a PDF page in grayscale with pdftoppm"""
+        left, top, right, bottom = box
+        command = [
+            'pdftoppm', '-r', str(PDF_DPI), '-f', str(page_num), '-l', str(page_num),
+            '-x', str(left), '-y', str(top), '-W', str(right - left), '-H', str(bottom - top),
+            '-gray', '-singlefile', pdf_path
+        ]
+        # Without an output root pdftoppm writes the PGM image to stdout
+        completed = subprocess.run(command, capture_output=True, check=True)
+        image = Image.open(io.BytesIO(completed.stdout))
+        image.load()
+        return image
+    
+    def process_pdf_progressive(self, pdf_path: str, language: str = 'eng+ara', pages: Optional[List[int]] = None, submit: Optional[Callable] = None,
+                                on_draft: Optional[Callable] = None, threshold: float = PROGRESSIVE_CONFIDENCE_THRESHOLD,
+                                draft_dpi: int = PROGRESSIVE_DRAFT_DPI, admit: Optional[Callable] = None) -> List[Dict[str, Any]]:
+        """
+        Two-pass OCR: every page at draft_dpi first (handed to on_draft as soon as
+        all drafts are done), then only low-confidence lines again at PDF_DPI.
+        Both passes work through PDF_BATCH_PAGES pages at a time under admit.
+        """
+        run = submit or (lambda fn, *args: _ImmediateResult(fn(*args)))
+        admit = admit or (lambda batch, dpi: nullcontext())
+        
+        try:
+            batches = self._page_batches(pdf_path, pages)
+            drafts = []
+            for batch in batches:
+                with admit(batch, draft_dpi):
+                    numbered_images = self._render_batch(pdf_path, batch, draft_dpi)
+                    futures = [run(self.draft_page, image, page_num, language, draft_dpi) for page_num, image in numbered_images]
+                    drafts.extend(future.result() for future in futures)
+                    del numbered_images
+            
+            if on_draft is not None:
+                on_draft([{key: value for key, value in draft.items() if key != 'layout'} for draft in drafts])
+            
+            results = []
+            for start in range(0, len(drafts), PDF_BATCH_PAGES):
+                batch_drafts = drafts[start:start + PDF_BATCH_PAGES]
+                with admit([draft['page_number'] for draft in batch_drafts], PDF_DPI):
+                    futures = [run(self.refine_page, pdf_path, draft, threshold, draft_dpi) for draft in batch_drafts]
+                    results.extend(future.result() for future in futures)
+            return results
+        
+        except AdmissionRejected:
+            raise
+        except Exception as e:
+            logger.error(f"Error processing PDF progressively: {e}")
+            return [{
+                'engine': self.name,
+                'text': '',
+                'confidence': 0,
+                'word_count': 0,
+                'language': language,
+                'success': False,
+                'error': str(e),
+                'page_number': pages[0] if pages else 1
             }]
 
 class ExternalOCREngine(OCREngine):
@@ -159,8 +608,8 @@ class OCRManager:
         """Get list of available OCR engines"""
         return list(self.engines.keys())
     
-    def process_image(self, image_path: str, engines: List[str] = None, language: str = 'eng+ara') -> Dict[str, Any]:
-        """Process image with specified OCR engines"""
+    def process_image(self, image_path: str, engines: List[str] = None, language: str = 'eng+ara', submit: Optional[Callable] = None, dedup: Optional[Any] = None) -> Dict[str, Any]:
+        """Process image with specified OCR engines, optionally through a page scheduler's submit callable"""
         if engines is None:
             engines = ['tesseract']
         
@@ -170,7 +619,10 @@ class OCRManager:
             if engine_name in self.engines:
                 engine = self.engines[engine_name]
                 if hasattr(engine, 'extract_text'):
-                    result = engine.extract_text(image_path, language)
+                    if submit is None:
+                        result = engine.extract_text(image_path, language, dedup)
+                    else:
+                        result = submit(engine.extract_text, image_path, language, dedup).result()
                     results[engine_name] = result
                 else:
                     logger.warning(f"Engine {engine_name} does not support image processing")
@@ -179,8 +631,13 @@ class OCRManager:
         
         return results
     
-    def process_pdf(self, pdf_path: str, engines: List[str] = None, language: str = 'eng+ara') -> Dict[str, List[Dict[str, Any]]]:
-        """Process PDF with specified OCR engines"""
+    def process_pdf(self, pdf_path: str, engines: List[str] = None, language: str = 'eng+ara', pages: Optional[List[int]] = None, submit: Optional[Callable] = None, dedup: Optional[Any] = None,
+                    progressive: bool = False, on_draft: Optional[Callable] = None, admit: Optional[Callable] = None) -> Dict[str, List[Dict[str, Any]]]:
+        """
+        Process PDF with specified OCR engines, optionally limited to some page numbers and scheduled per page.
+        With progressive=True, engines that support it OCR a low-DPI draft first and refine weak lines.
+        admit(page_numbers, dpi) returns a context manager held while a batch of pages is in memory.
+        """
         if engines is None:
             engines = ['tesseract']
         
@@ -189,8 +646,12 @@ class OCRManager:
         for engine_name in engines:
             if engine_name in self.engines:
                 engine = self.engines[engine_name]
-                if hasattr(engine, 'process_pdf'):
-                    result = engine.process_pdf(pdf_path, language)
+                if progressive and hasattr(engine, 'process_pdf_progressive'):
+                    draft_callback = (lambda drafts, name=engine_name: on_draft(name, drafts)) if on_draft else None
+                    result = engine.process_pdf_progressive(pdf_path, language, pages, submit, draft_callback, admit=admit)
+                    results[engine_name] = result
+                elif hasattr(engine, 'process_pdf'):
+                    result = engine.process_pdf(pdf_path, language, pages, submit, dedup, admit)
                     results[engine_name] = result
                 else:
                     logger.warning(f"Engine {engine_name} does not support PDF processing")
@@ -204,6 +665,134 @@ class OCRManager:
         external_engine = ExternalOCREngine(engine_name)
         return external_engine.process_external_text(text, confidence)
     
+    def get_pdf_page_count(self, pdf_path: str) -> Optional[int]:
+        """Get the number of pages in a PDF without rendering it"""
+        try:
+            return pdfinfo_from_path(pdf_path)['Pages']
+        except Exception as e:
+            logger.warning(f"Could not read PDF page count: {e}")
+            return None
+    
+    def estimate_memory(self, file_path: str, file_extension: str, pages: Optional[List[int]] = None, dpi: int = PDF_DPI) -> int:
+        """Estimate the peak pixel memory (in bytes) needed to OCR a file, or the given PDF pages at dpi"""
+        try:
+            if file_extension == 'txt':
+                return os.path.getsize(file_path)
+            
+            if file_extension != 'pdf':
+                with Image.open(file_path) as image:
+                    width, height = image.size
+                    bands = len(image.getbands())
+                return int(width * height * bands * PIXEL_MEMORY_OVERHEAD)
+            
+            # PDF pages are rendered as RGB images, a batch at a time
+            info = pdfinfo_from_path(file_path)
+            page_count = len(pages) if pages else min(info['Pages'], PDF_BATCH_PAGES)
+            size_parts = info.get('Page size', '612 x 792 pts').split()
+            width_pts, height_pts = float(size_parts[0]), float(size_parts[2])
+            page_pixels = (width_pts / 72 * dpi) * (height_pts / 72 * dpi)
+            return int(page_pixels * 3 * page_count * PIXEL_MEMORY_OVERHEAD)
+        except Exception as e:
+            logger.warning(f"Could not estimate memory for {file_path}, assuming upload size: {e}")
+            return int(os.path.getsize(file_path) * PIXEL_MEMORY_OVERHEAD)
+    
+    def without_layout(self, ocr_results: Dict[str, Any]) -> Dict[str, Any]:
+        """Copy of OCR results without the per-word geometry, which is only needed for exports"""
+        stripped = {}
+        for engine_name, result in ocr_results.items():
+            pages = result if isinstance(result, list) else [result]
+            pages = [{key: value for key, value in page.items() if key != 'layout'} for page in pages]
+            stripped[engine_name] = pages if isinstance(result, list) else pages[0]
+        return stripped
+    
+    def get_draft_text(self, ocr_results: Dict[str, Any]) -> Optional[str]:
+        """Get the combined progressive draft text of the first engine that produced one"""
+        for result in ocr_results.values():
+            if isinstance(result, list) and any('draft_text' in page for page in result):
+                return '\n\n'.join(page['draft_text'] for page in result if page.get('success', False) and 'draft_text' in page)
+        return None
+    
+    def get_detected_language(self, ocr_results: Dict[str, Any]) -> Optional[str]:
+        """Get the AI correction language from the scripts detected during OCR"""
+        scripts = []
+        for result in ocr_results.values():
+            pages = result if isinstance(result, list) else [result]
+            scripts.extend(page.get('detected_script') for page in pages if page.get('detected_script'))
+        
+        if not scripts:
+            return None
+        
+        return script_to_correction_language(scripts)
+    
+    def combine_document_results(self, ocr_results: Dict[str, Any], file_extension: str, method: str = 'best_confidence') -> Dict[str, Any]:
+        """Combine a document's OCR results (one or more engines, one or more pages) into a single text"""
+        if len(ocr_results) > 1:
+            return self.combine_results(ocr_results, method)
+        
+        # Single engine result
+        engine_name = list(ocr_results.keys())[0]
+        if file_extension == 'pdf':
+            # For PDF, combine all pages
+            pages_text = []
+            for page_result in ocr_results[engine_name]:
+                if page_result.get('success', False):
+                    pages_text.append(page_result['text'])
+        
+            combined_text = '\n\n'.join(pages_text)
+            avg_confidence = sum(page.get('confidence', 0) for page in ocr_results[engine_name]) / len(ocr_results[engine_name])
+        
+            return {
+                'combined_text': combined_text,
+                'confidence': avg_confidence,
+                'method': 'single_engine',
+                'engines_used': [engine_name],
+                'success': bool(combined_text.strip()),
+                'best_engine': engine_name
+            }
+        
+        result = ocr_results[engine_name]
+        return {
+            'combined_text': result.get('text', ''),
+            'confidence': result.get('confidence', 0),
+            'method': 'single_engine',
+            'engines_used': [engine_name],
+            'success': result.get('success', False),
+            'best_engine': engine_name
+        }
+    
+    def apply_corrections(self, combined_result: Dict[str, Any], ocr_results: Dict[str, Any], language: str,
+                          local_corrector: Any, ai_corrector: Any, use_ai_correction: bool, context: str = '',
+                          local_mode: str = 'prepass') -> Tuple[Optional[Dict[str, Any]], Optional[Dict[str, Any]], str]:
+        """
+        Apply local and AI correction to combined OCR text.
+        local_mode is 'prepass' (local fixes before the LLM, so only with AI
+        correction on), 'only' (offline correction, no LLM) or 'off'.
+        Returns the local correction, the AI correction and the final text.
+        """
+        local_result = None
+        ai_result = None
+        final_text = combined_result['combined_text']
+        
+        if not combined_result['success']:
+            return local_result, ai_result, final_text
+        
+        # Prefer the script detected on the pages over the requested OCR languages
+        correction_language = self.get_detected_language(ocr_results) or language
+        
+        # Ahead of the LLM only conservative fixes are made; names are left to the LLM
+        run_local = local_mode == 'only' or (local_mode == 'prepass' and use_ai_correction)
+        if run_local and local_corrector.is_available():
+            local_result = local_corrector.correct_text(final_text, correction_language, context, conservative=local_mode == 'prepass')
+            if local_result['success']:
+                final_text = local_result['corrected_text']
+        
+        if local_mode != 'only' and use_ai_correction and ai_corrector.is_available():
+            ai_result = ai_corrector.correct_text(final_text, correction_language, context)
+            if ai_result['success']:
+                final_text = ai_result['corrected_text']
+        
+        return local_result, ai_result, final_text
+    
     def combine_results(self, results: Dict[str, Any], method: str = 'best_confidence') -> Dict[str, Any]:
         """Combine results from multiple OCR engines"""
         if not results:
@@ -0,0 +1,285 @@
+"""
+Page Hash Module
+Perceptual hashing of page images so visually identical pages (letterheads,
+standard forms, cover sheets) reuse an earlier OCR result instead of being
+OCR'd again. Results are only shared within one namespace (a client), never
+across clients.
+"""
+
+import os
+import re
+import sys
+import threading
+import logging
+from array import array
+from collections import Counter, OrderedDict
+from difflib import SequenceMatcher
+from typing import Dict, Any, Optional, List, Tuple, Callable
+from PIL import Image
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Deduplication settings, configurable through the environment
+PAGE_DEDUP_MODE = os.getenv('PAGE_DEDUP_MODE', 'off')
+PAGE_HASH_THRESHOLD = int(os.getenv('PAGE_HASH_THRESHOLD', 4))
+PAGE_HASH_MAX_ENTRIES = int(os.getenv('PAGE_HASH_MAX_ENTRIES', 10000))
+PAGE_HASH_MAX_MB = int(os.getenv('PAGE_HASH_MAX_MB', 64))
+PAGE_PROBE_SIMILARITY = float(os.getenv('PAGE_PROBE_SIMILARITY', 0.9))
+
+# Modes: 'reuse' trusts the 64-bit hash alone, 'verify' also requires a
+# 1024-bit hash of a finer thumbnail to agree and a low-resolution OCR probe
+# of the new page to read like the stored result. Thumbnails cannot tell
+# apart forms that differ in a single field, so only 'verify' is safe for
+# documents like that.
+DEDUP_MODES = ('off', 'reuse', 'verify')
+
+HASH_BITS = 64
+FINE_HASH_SIZE = 32
+
+# Allowed fine-hash distance per bit of coarse-hash threshold; kept below the
+# 16x bit ratio so verification is stricter than the coarse match
+FINE_THRESHOLD_FACTOR = 8
+
+def difference_hash(image: Image.Image, size: int = 8) -> int:
+    """dHash: one bit per horizontally adjacent pixel pair of a size x size grayscale thumbnail"""
+    pixels = list(image.convert('L').resize((size + 1, size), Image.BILINEAR).getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+def hamming_distance(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+def pack_layout(layout: Dict[str, Any]) -> Dict[str, Any]:
+    """Word geometry as flat arrays, a few dozen bytes per word instead of a dict per word"""
+    lines = layout['lines']
+    words = [word for line in lines for word in line['words']]
+    return {
+        'width': layout['width'],
+        'height': layout['height'],
+        'dpi': layout['dpi'],
+        'blocks': array('i', [line['block'] for line in lines]),
+        'line_lengths': array('i', [len(line['words']) for line in lines]),
+        # Tesseract words never contain whitespace
+        'texts': '\n'.join(word['text'] for word in words),
+        'confidences': array('d', [word['confidence'] for word in words]),
+        'boxes': array('i', [value for word in words for value in word['box']])
+    }
+
+def unpack_layout(packed: Dict[str, Any]) -> Dict[str, Any]:
+    """Rebuild the layout dict returned by the OCR engines from pack_layout's arrays"""
+    texts = packed['texts'].split('\n')
+    confidences, boxes = packed['confidences'], packed['boxes']
+    lines = []
+    position = 0
+    for block, length in zip(packed['blocks'], packed['line_lengths']):
+        lines.append({
+            'block': block,
+            'words': [
+                {'text': texts[i], 'confidence': confidences[i], 'box': tuple(boxes[4 * i:4 * i + 4])}
+                for i in range(position, position + length)
+            ]
+        })
+        position += length
+    return {'width': packed['width'], 'height': packed['height'], 'dpi': packed['dpi'], 'lines': lines}
+
+def _record_size(record: Dict[str, Any]) -> int:
+    """Approximate bytes held by a stored record: its result values and packed layout arrays"""
+    result = record['result']
+    size = sys.getsizeof(record) + sys.getsizeof(result) + sum(sys.getsizeof(value) for value in result.values())
+    if isinstance(result.get('layout'), dict):
+        size += sum(sys.getsizeof(value) for value in result['layout'].values())
+    return size
+
+class PageHashIndex:
+    """
+    Bounded nearest-neighbour index over 64-bit page hashes.
+
+    The hash is split into threshold + 1 bands; by the pigeonhole principle
+    two hashes within the threshold share at least one band exactly, so a
+    lookup only compares against pages found in the query's band buckets.
+    Least recently used pages are evicted past max_entries or max_bytes.
+    """
+
+    def __init__(self, threshold: int = PAGE_HASH_THRESHOLD, max_entries: int = PAGE_HASH_MAX_ENTRIES,
+                 max_bytes: int = PAGE_HASH_MAX_MB * 1024 * 1024):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.size_bytes = 0
+        self.band_count = min(max(threshold + 1, 4), HASH_BITS)
+        self.band_bits = HASH_BITS // self.band_count
+        self._entries = OrderedDict()
+        self._buckets = [dict() for _ in range(self.band_count)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _bands(self, page_hash: int) -> List[int]:
+        mask = (1 << self.band_bits) - 1
+        return [(page_hash >> (band * self.band_bits)) & mask for band in range(self.band_count)]
+
+    def find(self, page_hash: int, key: Tuple[str, str, str]) -> Optional[Tuple[Dict[str, Any], int]]:
+        """Closest stored page with a result for key (namespace, engine, language), with its distance"""
+        with self._lock:
+            candidate_ids = set()
+            for band, value in enumerate(self._bands(page_hash)):
+                candidate_ids.update(self._buckets[band].get(value, ()))
+
+            best = None
+            for entry_id in candidate_ids:
+                entry = self._entries[entry_id]
+                if key not in entry['results']:
+                    continue
+                distance = hamming_distance(page_hash, entry['hash'])
+                if distance <= self.threshold and (best is None or distance < best[1]):
+                    best = (entry, distance)
+
+            if best:
+                self._entries.move_to_end(best[0]['id'])
+            return best
+
+    def add(self, page_hash: int, fine_hash: int, key: Tuple[str, str, str], record: Dict[str, Any]):
+        """Store a page's OCR result record, merging it into an identical-hash entry if there is one"""
+        record = dict(record, size=_record_size(record))
+        with self._lock:
+            self.size_bytes += record['size']
+            for entry_id in self._buckets[0].get(self._bands(page_hash)[0], ()):
+                entry = self._entries[entry_id]
+                if entry['hash'] == page_hash and entry['fine_hash'] == fine_hash:
+                    if key in entry['results']:
+                        self.size_bytes -= entry['results'][key]['size']
+                    entry['results'][key] = record
+                    break
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+                self._entries[entry_id] = {
+                    'id': entry_id,
+                    'hash': page_hash,
+                    'fine_hash': fine_hash,
+                    'results': {key: record}
+                }
+                for band, value in enumerate(self._bands(page_hash)):
+                    self._buckets[band].setdefault(value, set()).add(entry_id)
+
+            while self._entries and (len(self._entries) > self.max_entries or self.size_bytes > self.max_bytes):
+                self._evict()
+
+    def _evict(self):
+        entry_id, entry = self._entries.popitem(last=False)
+        self.size_bytes -= sum(record['size'] for record in entry['results'].values())
+        for band, value in enumerate(self._bands(entry['hash'])):
+            bucket = self._buckets[band].get(value)
+            if bucket is not None:
+                bucket.discard(entry_id)
+                if not bucket:
+                    del self._buckets[band][value]
+
+    def __len__(self):
+        return len(self._entries)
+
+def _numbers(words: List[str]) -> Counter:
+    return Counter(re.sub(r'[^\w]', '', word) for word in words if any(char.isdigit() for char in word))
+
+def texts_match(probe_text: str, stored_text: str, similarity: float = PAGE_PROBE_SIMILARITY) -> bool:
+    """
+    Whether a probe reads like a stored page: word-level similarity of at
+    least similarity, since rescans rarely OCR identically, and the same
+    numbers, since forms differing in one amount or date are otherwise similar
+    """
+    probe_words, stored_words = probe_text.split(), stored_text.split()
+    if not probe_words or not stored_words:
+        return probe_words == stored_words
+    if SequenceMatcher(None, probe_words, stored_words, autojunk=False).ratio() < similarity:
+        return False
+    return _numbers(probe_words) == _numbers(stored_words)
+
+class PageDeduplicator:
+    """
+    Per-job view of the shared page hash index, with the job's match
+    statistics. Only results stored under the same namespace are reused.
+    """
+
+    def __init__(self, index: PageHashIndex, mode: str = PAGE_DEDUP_MODE, namespace: str = 'default'):
+        self.index = index
+        self.mode = mode if mode in DEDUP_MODES else 'off'
+        self.namespace = namespace
+        self.stats = {
+            'mode': self.mode,
+            'pages_checked': 0,
+            'matches': 0,
+            'reused': 0,
+            'rejected_by_verification': 0
+        }
+        self._lock = threading.Lock()
+
+    def enabled(self) -> bool:
+        return self.mode != 'off'
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def lookup(self, image: Image.Image, engine: str, language: str,
+               probe: Optional[Callable[[Image.Image], str]] = None) -> Tuple[Optional[Dict[str, Any]], Dict[str, Any]]:
+        """
+        Return a copy of an earlier result for a near-identical page (or None)
+        and the page's fingerprint, to pass back to store() after OCR.
+        In verify mode, probe is a cheap OCR of the page; it only runs when a
+        stored page passed both hash checks.
+        """
+        fingerprint = {'hash': difference_hash(image), 'fine_hash': difference_hash(image, FINE_HASH_SIZE)}
+        self._count('pages_checked')
+
+        key = (self.namespace, engine, language)
+        match = self.index.find(fingerprint['hash'], key)
+        if match is None:
+            return None, fingerprint
+
+        entry, distance = match
+        record = entry['results'][key]
+        self._count('matches')
+
+        if self.mode == 'verify' and not self._verify(image, fingerprint, entry, record, probe):
+            self._count('rejected_by_verification')
+            return None, fingerprint
+
+        self._count('reused')
+        result = dict(record['result'])
+        if 'layout' in result:
+            result['layout'] = unpack_layout(result['layout'])
+        result['reused_from'] = {'page_number': record['page_number'], 'hash_distance': distance}
+        return result, fingerprint
+
+    def _verify(self, image: Image.Image, fingerprint: Dict[str, Any], entry: Dict[str, Any], record: Dict[str, Any],
+                probe: Optional[Callable[[Image.Image], str]]) -> bool:
+        fine_distance = hamming_distance(fingerprint['fine_hash'], entry['fine_hash'])
+        if fine_distance > self.index.threshold * FINE_THRESHOLD_FACTOR or probe is None:
+            return False
+        try:
+            return texts_match(probe(image), record['result'].get('text', ''))
+        except Exception as e:
+            logger.warning(f"Page probe failed, not reusing results for this page: {e}")
+            return False
+
+    def store(self, fingerprint: Dict[str, Any], engine: str, language: str, result: Dict[str, Any], page_number: Optional[int] = None):
+        """Remember a freshly OCR'd page for later jobs in the same namespace"""
+        if not result.get('success', False):
+            return
+        stored = {key: value for key, value in result.items() if key not in ('page_number', 'reused_from')}
+        if stored.get('layout'):
+            stored['layout'] = pack_layout(stored['layout'])
+        record = {
+            'result': stored,
+            'page_number': page_number
+        }
+        self.index.add(fingerprint['hash'], fingerprint['fine_hash'], (self.namespace, engine, language), record)
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self.stats)
@@ -0,0 +1,243 @@
+"""
+Profiling Module
+Opt-in, per-request CPU and allocation profiling. Nothing here runs unless a
+request explicitly asks for a profile with a valid token.
+
+Both profilers hook the interpreter, not the request: allocation tracing
+(itself opt-in, as it slows every thread) sees the whole process, and on
+Python 3.12+ cProfile records every thread. Each summary states what its
+numbers cover.
+"""
+
+import os
+import io
+import hmac
+import sys
+import time
+import uuid
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import logging
+from contextvars import ContextVar
+from typing import Callable, Dict, Any, Optional
+from dotenv import load_dotenv
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows; child process CPU time is then not reported
+    resource = None
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Profiling is disabled unless a token is configured
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '')
+PROFILE_FOLDER = os.getenv('PROFILE_FOLDER') or os.path.join(os.path.dirname(os.path.dirname(__file__)), 'profiles')
+
+# How long stored profiles are kept
+PROFILE_TTL_HOURS = float(os.getenv('PROFILE_TTL_HOURS', 24))
+
+# Stack depth kept for each allocation; deeper is more useful but slower
+TRACEMALLOC_FRAMES = 10
+
+# Rows in the human-readable summary
+SUMMARY_FUNCTIONS = 40
+SUMMARY_ALLOCATIONS = 25
+
+# Files written for each profile, by artifact name
+PROFILE_ARTIFACTS = {
+    'cpu': '.prof',
+    'allocations': '.tracemalloc',
+    'summary': '.txt'
+}
+
+_current_session = ContextVar('profiling_session', default=None)
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+_sessions_lock = threading.Lock()
+_active_sessions = 0
+
+def is_authorized(token: Optional[str]) -> bool:
+    """Check a profiling token in constant time"""
+    return bool(PROFILING_TOKEN) and bool(token) and hmac.compare_digest(token, PROFILING_TOKEN)
+
+def current_session() -> Optional['ProfilingSession']:
+    """The profiling session of the current request, if it asked for one"""
+    return _current_session.get()
+
+def artifact_path(profile_id: str, artifact: str) -> Optional[str]:
+    """Path of a stored profile artifact, or None for unknown ids and artifact names"""
+    suffix = PROFILE_ARTIFACTS.get(artifact)
+    try:
+        uuid.UUID(hex=profile_id)
+    except ValueError:
+        return None
+    if suffix is None:
+        return None
+    return os.path.join(PROFILE_FOLDER, profile_id + suffix)
+
+def purge_expired_profiles(ttl_hours: float = PROFILE_TTL_HOURS):
+    """Delete stored profile artifacts older than the TTL"""
+    if not os.path.isdir(PROFILE_FOLDER):
+        return
+    cutoff = time.time() - ttl_hours * 3600
+    for entry in os.scandir(PROFILE_FOLDER):
+        profile_id, suffix = os.path.splitext(entry.name)
+        if suffix not in PROFILE_ARTIFACTS.values() or artifact_path(profile_id, 'cpu') is None:
+            continue
+        try:
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+class ProfilingSession:
+    """
+    Collects one request's CPU profile, including page tasks run on scheduler
+    threads, plus a tracemalloc snapshot. cProfile uses wall-clock time, so
+    waits on Tesseract subprocesses and OpenAI calls show up as time spent in
+    the calls that block on them.
+    """
+
+    def __init__(self, allocations: bool = False):
+        self.profile_id = uuid.uuid4().hex
+        self.allocations = allocations
+        self._profiler = cProfile.Profile()
+        self._thread_profiles = []
+        self._lock = threading.Lock()
+        self._context_token = None
+        self._started = None
+        self._children_cpu = None
+        self._cpu_profiling = False
+        self._max_concurrent = 1
+
+    def start(self):
+        global _tracemalloc_users, _active_sessions
+        if self.allocations:
+            with _tracemalloc_lock:
+                if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+                    tracemalloc.start(TRACEMALLOC_FRAMES)
+                _tracemalloc_users += 1
+        with _sessions_lock:
+            _active_sessions += 1
+            self._max_concurrent = _active_sessions
+
+        self._children_cpu = self._get_children_cpu()
+        self._started = time.perf_counter()
+        self._context_token = _current_session.set(self)
+        try:
+            self._profiler.enable()
+            self._cpu_profiling = True
+        except ValueError:
+            logger.warning("Another profiler is active; only scheduler threads will be profiled")
+
+    @staticmethod
+    def _get_children_cpu() -> Optional[float]:
+        if resource is None:
+            return None
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    def wrap(self, fn: Callable) -> Callable:
+        """Profile a function when it runs on another thread, e.g. a scheduler worker"""
+        def profiled(*args, **kwargs):
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # Python 3.12+ allows one active profiler per interpreter, and
+                # it already sees this thread
+                return fn(*args, **kwargs)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+                with self._lock:
+                    self._thread_profiles.append(profiler)
+        return profiled
+
+    def stop(self) -> Dict[str, Any]:
+        """Stop profiling and write the artifacts to PROFILE_FOLDER"""
+        global _tracemalloc_users, _active_sessions
+        if self._cpu_profiling:
+            self._profiler.disable()
+        wall_time = time.perf_counter() - self._started
+        if self._context_token is not None:
+            _current_session.reset(self._context_token)
+            self._context_token = None
+
+        # Process-wide: includes other requests' subprocesses finishing meanwhile
+        children_cpu = self._get_children_cpu()
+        if children_cpu is not None:
+            children_cpu -= self._children_cpu
+
+        with _sessions_lock:
+            self._max_concurrent = max(self._max_concurrent, _active_sessions)
+            _active_sessions -= 1
+
+        snapshot = None
+        if self.allocations:
+            if tracemalloc.is_tracing():
+                # Leave out the profilers' own bookkeeping
+                snapshot = tracemalloc.take_snapshot().filter_traces([
+                    tracemalloc.Filter(False, tracemalloc.__file__),
+                    tracemalloc.Filter(False, __file__)
+                ])
+            with _tracemalloc_lock:
+                _tracemalloc_users -= 1
+                if _tracemalloc_users == 0:
+                    tracemalloc.stop()
+
+        purge_expired_profiles()
+        os.makedirs(PROFILE_FOLDER, exist_ok=True)
+        stats = pstats.Stats(self._profiler) if self._cpu_profiling else pstats.Stats()
+        with self._lock:
+            for profiler in self._thread_profiles:
+                stats.add(profiler)
+        stats.dump_stats(artifact_path(self.profile_id, 'cpu'))
+        if snapshot is not None:
+            snapshot.dump(artifact_path(self.profile_id, 'allocations'))
+
+        summary = io.StringIO()
+        summary.write(f"Profile {self.profile_id}\n")
+        summary.write(f"Wall time: {wall_time:.3f}s\n")
+        if children_cpu is not None:
+            summary.write(f"Child process CPU time: {children_cpu:.3f}s\n")
+        summary.write(f"Threads profiled: {1 + len(self._thread_profiles)}\n")
+        summary.write("Scope:\n")
+        if sys.version_info >= (3, 12):
+            summary.write("  CPU: every thread of the process (cProfile cannot be limited to one request on Python 3.12+)\n")
+        else:
+            summary.write("  CPU: the request thread and its page tasks on scheduler workers\n")
+        if snapshot is not None:
+            summary.write("  Allocations: whole process, including other requests running at the same time\n")
+        else:
+            summary.write("  Allocations: not traced (send X-Profile-Allocations: 1 to trace them)\n")
+        summary.write("  Child process CPU time: whole process\n")
+        if self._max_concurrent > 1:
+            summary.write(f"  Up to {self._max_concurrent} profiled requests overlapped with this one\n")
+        summary.write("\n")
+        stats.stream = summary
+        stats.sort_stats('cumulative').print_stats(SUMMARY_FUNCTIONS)
+        if snapshot is not None:
+            summary.write("\nTop allocations by line:\n")
+            for statistic in snapshot.statistics('lineno')[:SUMMARY_ALLOCATIONS]:
+                summary.write(f"{statistic}\n")
+        with open(artifact_path(self.profile_id, 'summary'), 'w', encoding='utf-8') as f:
+            f.write(summary.getvalue())
+
+        logger.info(f"Stored profile {self.profile_id} ({wall_time:.3f}s)")
+        return {
+            'profile_id': self.profile_id,
+            'wall_time_seconds': round(wall_time, 3),
+            'children_cpu_seconds': round(children_cpu, 3) if children_cpu is not None else None
+        }
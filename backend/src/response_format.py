@@ -0,0 +1,173 @@
+"""
+Response Format Module
+Field projection, a compact shared-text schema and negotiated compression
+for OCR API responses
+"""
+
+import gzip
+import time
+import logging
+from typing import Dict, Any, List, Optional
+from flask import Response, current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Fields holding OCR text; in the compact schema their repeated values are
+# stored once. Identifiers like file_id are never touched.
+COMPACT_TEXT_FIELDS = {'text', 'combined_text', 'original_text', 'corrected_text', 'final_text', 'draft_text'}
+
+# Responses smaller than this are not worth compressing
+COMPRESSION_MIN_SIZE = 4096
+
+# Compression levels chosen for speed; OCR text compresses well even at low levels
+GZIP_LEVEL = 5
+BROTLI_QUALITY = 4
+
+def project_fields(data: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+    """Keep only the requested fields; dotted paths select nested keys (e.g. combined_result.confidence)"""
+    projected = {'success': data.get('success', True)}
+
+    for field in fields:
+        source = data
+        target = projected
+        parts = field.split('.')
+        for part in parts[:-1]:
+            if not isinstance(source, dict) or part not in source:
+                break
+            source = source[part]
+            target = target.setdefault(part, {})
+        else:
+            if isinstance(source, dict) and parts[-1] in source:
+                target[parts[-1]] = source[parts[-1]]
+
+    return projected
+
+def compact_texts(data: Any) -> Dict[str, Any]:
+    """
+    Replace OCR text fields whose value occurs more than once with
+    {"$text": index} references into a shared "texts" list, so each repeated
+    text is serialized only once
+    """
+    counts = {}
+
+    def count(value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                if key in COMPACT_TEXT_FIELDS and isinstance(item, str) and item:
+                    counts[item] = counts.get(item, 0) + 1
+                else:
+                    count(item)
+        elif isinstance(value, list):
+            for item in value:
+                count(item)
+
+    texts = []
+    index_by_text = {}
+
+    def visit(value):
+        if isinstance(value, dict):
+            compacted = {}
+            for key, item in value.items():
+                if key in COMPACT_TEXT_FIELDS and isinstance(item, str) and counts.get(item, 0) > 1:
+                    if item not in index_by_text:
+                        index_by_text[item] = len(texts)
+                        texts.append(item)
+                    compacted[key] = {'$text': index_by_text[item]}
+                else:
+                    compacted[key] = visit(item)
+            return compacted
+        if isinstance(value, list):
+            return [visit(item) for item in value]
+        return value
+
+    count(data)
+    compacted = visit(data)
+    compacted['texts'] = texts
+    compacted['format'] = 'compact'
+    return compacted
+
+def parse_fields(value: Optional[Any]) -> List[str]:
+    """Parse a fields parameter given as a comma-separated string or a list"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [field.strip() for field in value if field and field.strip()]
+
+def format_response(data: Dict[str, Any], fields: Optional[Any] = None, response_format: Optional[str] = None) -> Response:
+    """Serialize an API response with optional field projection and compact schema"""
+    started = time.perf_counter()
+
+    field_list = parse_fields(fields)
+    if field_list:
+        data = project_fields(data, field_list)
+    if response_format == 'compact':
+        data = compact_texts(data)
+
+    body = current_app.json.dumps(data)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    response = Response(body, mimetype='application/json')
+    response.headers['Server-Timing'] = f'serialize;dur={elapsed_ms:.2f}'
+    return response
+
+def _choose_encoding(accept_encoding: str) -> Optional[str]:
+    """Pick the best supported content coding the client accepts"""
+    accepted = {}
+    for part in accept_encoding.split(','):
+        pieces = part.strip().split(';')
+        coding = pieces[0].strip().lower()
+        quality = 1.0
+        for param in pieces[1:]:
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            accepted[coding] = quality
+
+    for coding in ('br', 'gzip'):
+        if coding == 'br' and brotli is None:
+            continue
+        if accepted.get(coding, accepted.get('*', 0)) > 0:
+            return coding
+    return None
+
+def compress_response(response: Response, accept_encoding: str) -> Response:
+    """Compress large JSON responses with brotli or gzip when the client accepts it"""
+    if (response.direct_passthrough or response.is_streamed or
+            'Content-Encoding' in response.headers or response.mimetype != 'application/json'):
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESSION_MIN_SIZE:
+        return response
+
+    response.vary.add('Accept-Encoding')
+    encoding = _choose_encoding(accept_encoding or '')
+    if encoding is None:
+        return response
+
+    started = time.perf_counter()
+    if encoding == 'br':
+        compressed = brotli.compress(body, quality=BROTLI_QUALITY)
+    else:
+        compressed = gzip.compress(body, compresslevel=GZIP_LEVEL)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+
+    response.set_data(compressed)
+    response.headers['Content-Encoding'] = encoding
+    response.headers['X-Uncompressed-Length'] = str(len(body))
+    timing = response.headers.get('Server-Timing')
+    compress_timing = f'compress;dur={elapsed_ms:.2f}'
+    response.headers['Server-Timing'] = f'{timing}, {compress_timing}' if timing else compress_timing
+    return response
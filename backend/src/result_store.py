@@ -0,0 +1,196 @@
+"""
+Result Store Module
+Keeps OCR output server-side under its file_id so settings changes can be
+re-combined or re-corrected without uploading and OCRing the document again
+"""
+
+import os
+import logging
+from datetime import datetime, timedelta
+from typing import List, Dict, Any, Optional, Tuple, Iterator
+from src.models.user import db
+from src.models.ocr_result import OCRDocument, OCRPageResult
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How long stored OCR output (and the uploaded file) is kept
+RESULT_TTL_HOURS = float(os.getenv('RESULT_TTL_HOURS', 24))
+
+# Page rows fetched per round trip when iterating over a document's pages
+PAGE_BATCH_SIZE = 20
+
+# Progressive drafts are stored under the engine name with this suffix until
+# the refined results replace them
+DRAFT_SUFFIX = ':draft'
+
+class ResultStore:
+    """Stores per-page OCR results keyed by file_id, engine and language"""
+
+    def __init__(self, ttl_hours: float = RESULT_TTL_HOURS):
+        self.ttl = timedelta(hours=ttl_hours)
+
+    def save_document(self, file_id: str, filename: str, file_extension: str, file_path: Optional[str], page_count: Optional[int] = None, settings: Optional[Dict[str, Any]] = None) -> OCRDocument:
+        """Register an uploaded document and start its expiry clock"""
+        self.purge_expired()
+
+        now = datetime.now()
+        document = OCRDocument(
+            file_id=file_id,
+            filename=filename,
+            file_extension=file_extension,
+            file_path=file_path,
+            page_count=page_count,
+            settings=settings,
+            created_at=now,
+            expires_at=now + self.ttl
+        )
+        db.session.add(document)
+        db.session.commit()
+        return document
+
+    def get_document(self, file_id: str) -> Optional[OCRDocument]:
+        """Get a stored document, or None if it is unknown or expired"""
+        document = db.session.get(OCRDocument, file_id)
+        if document is None:
+            return None
+
+        if document.expires_at <= datetime.now():
+            self.delete_document(file_id)
+            return None
+
+        return document
+
+    def update_settings(self, document: OCRDocument, settings: Dict[str, Any]):
+        """Remember the settings last used for a document"""
+        document.settings = settings
+        db.session.commit()
+
+    def save_results(self, file_id: str, ocr_results: Dict[str, Any], language: str):
+        """Store OCR results, replacing earlier results for the same pages and settings"""
+        for engine_name, result in ocr_results.items():
+            pages = result if isinstance(result, list) else [result]
+            for page in pages:
+                page_number = page.get('page_number')
+                OCRPageResult.query.filter_by(
+                    file_id=file_id, engine=engine_name, language=language, page_number=page_number
+                ).delete()
+                db.session.add(OCRPageResult(
+                    file_id=file_id,
+                    engine=engine_name,
+                    language=language,
+                    page_number=page_number,
+                    result=page
+                ))
+
+            # Refined results supersede the engine's progressive drafts
+            OCRPageResult.query.filter_by(file_id=file_id, engine=engine_name + DRAFT_SUFFIX).delete()
+
+        db.session.commit()
+
+    def save_drafts(self, file_id: str, engine_name: str, drafts: List[Dict[str, Any]], language: str):
+        """Store an engine's progressive drafts so they can be read while refinement is still running"""
+        self.save_results(file_id, {engine_name + DRAFT_SUFFIX: drafts}, language)
+
+    def get_status(self, document: OCRDocument) -> Dict[str, Any]:
+        """Processing status of a document, with the draft text while progressive refinement runs"""
+        rows = OCRPageResult.query.filter_by(file_id=document.file_id).order_by(OCRPageResult.page_number).all()
+        drafts = [row for row in rows if row.engine.endswith(DRAFT_SUFFIX)]
+        if drafts:
+            # One engine's drafts, as the combined text of other engines is not known yet
+            pages = [row.result['text'] for row in drafts if row.engine == drafts[0].engine and row.result.get('success', False)]
+            return {'status': 'refining', 'draft_text': '\n\n'.join(pages)}
+        if rows:
+            return {'status': 'complete', 'draft_text': None}
+        return {'status': 'processing', 'draft_text': None}
+
+    def load_results(self, document: OCRDocument, engines: List[str], language: str) -> Tuple[Dict[str, Any], Dict[str, Optional[List[int]]]]:
+        """
+        Load stored results for the requested engines and language.
+
+        Returns the usable results and, per engine, the pages that still need
+        OCR: None means the whole document, a list names individual PDF pages.
+        Results stored under other settings, and failed pages, are not reused.
+        """
+        results = {}
+        missing = {}
+
+        for engine_name in engines:
+            rows = OCRPageResult.query.filter_by(
+                file_id=document.file_id, engine=engine_name, language=language
+            ).all()
+
+            if document.file_extension != 'pdf':
+                if rows and rows[0].result.get('success', False):
+                    results[engine_name] = rows[0].result
+                else:
+                    missing[engine_name] = None
+                continue
+
+            pages = {row.page_number: row.result for row in rows if row.result.get('success', False)}
+            if not pages:
+                missing[engine_name] = None
+                continue
+
+            page_count = document.page_count or max(pages)
+            stale_pages = [page_number for page_number in range(1, page_count + 1) if page_number not in pages]
+            if stale_pages:
+                missing[engine_name] = stale_pages
+            results[engine_name] = [pages[page_number] for page_number in sorted(pages)]
+
+        return results, missing
+
+    def has_results(self, document: OCRDocument, engine: str, language: str) -> bool:
+        """Check whether any page of a document was stored for an engine and language"""
+        return OCRPageResult.query.filter_by(
+            file_id=document.file_id, engine=engine, language=language
+        ).with_entities(OCRPageResult.id).first() is not None
+
+    def iter_results(self, document: OCRDocument, engine: str, language: str) -> Iterator[Tuple[int, Optional[Dict[str, Any]]]]:
+        """
+        Yield (page_number, result) in page order without loading the whole
+        document at once. Failed and missing PDF pages yield None, so every
+        page of the document is accounted for.
+        """
+        rows = OCRPageResult.query.filter_by(
+            file_id=document.file_id, engine=engine, language=language
+        ).order_by(OCRPageResult.page_number).yield_per(PAGE_BATCH_SIZE)
+
+        if document.file_extension != 'pdf':
+            row = next(iter(rows), None)
+            yield 1, row.result if row is not None and row.result.get('success', False) else None
+            return
+
+        next_page = 1
+        for row in rows:
+            for page_number in range(next_page, row.page_number):
+                yield page_number, None
+            yield row.page_number, row.result if row.result.get('success', False) else None
+            next_page = row.page_number + 1
+
+        for page_number in range(next_page, (document.page_count or 0) + 1):
+            yield page_number, None
+
+    def delete_document(self, file_id: str):
+        """Delete a stored document, its results and its uploaded file"""
+        document = db.session.get(OCRDocument, file_id)
+        if document is None:
+            return
+
+        if document.file_path:
+            try:
+                os.remove(document.file_path)
+            except OSError:
+                pass
+
+        OCRPageResult.query.filter_by(file_id=file_id).delete()
+        db.session.delete(document)
+        db.session.commit()
+
+    def purge_expired(self):
+        """Delete all expired documents"""
+        expired = OCRDocument.query.filter(OCRDocument.expires_at <= datetime.now()).all()
+        for document in expired:
+            logger.info(f"Purging expired OCR results for {document.file_id}")
+            self.delete_document(document.file_id)
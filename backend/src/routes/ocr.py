@@ -7,10 +7,18 @@ import os
 import tempfile
 import uuid
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, g, send_file, stream_with_context
 from werkzeug.utils import secure_filename
-from src.ocr_engines import OCRManager
+from src.ocr_engines import OCRManager, PDF_DPI
 from src.ai_corrector import AICorrector
+from src.local_corrector import LocalCorrector
+from src.result_store import ResultStore
+from src.admission import AdmissionController, AdmissionRejected, MemoryBudgetExceeded
+from src.scheduler import PageScheduler
+from src.response_format import format_response, compress_response
+from src.page_hash import PageHashIndex, PageDeduplicator, PAGE_DEDUP_MODE
+from src.profiling import ProfilingSession, is_authorized, artifact_path
+from src.export import EXPORT_FORMATS, EXPORT_PDF_DPI, export_document, render_page_image
 import logging
 
 # Configure logging
@@ -23,14 +31,103 @@ ocr_bp = Blueprint('ocr', __name__)
 # Initialize OCR manager and AI corrector
 ocr_manager = OCRManager()
 ai_corrector = AICorrector()
+local_corrector = LocalCorrector()
+result_store = ResultStore()
+admission_controller = AdmissionController()
+page_scheduler = PageScheduler()
+page_hash_index = PageHashIndex()
 
 # Allowed file extensions
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'tiff', 'tif', 'pdf', 'txt'}
 
+@ocr_bp.before_request
+def start_profiling():
+    """Profile this request if it asks for it with X-Profile (or ?profile=true) and a valid token"""
+    requested = request.headers.get('X-Profile') or request.args.get('profile')
+    if not requested or requested.lower() not in ('1', 'true'):
+        return None
+    
+    if not is_authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({
+            'success': False,
+            'error': 'Profiling not authorized'
+        }), 403
+    
+    # Allocation tracing slows every thread of the process, so it is opt-in too
+    allocations = (request.headers.get('X-Profile-Allocations') or '').lower() in ('1', 'true')
+    g.profiling_session = ProfilingSession(allocations)
+    g.profiling_session.start()
+    return None
+
+@ocr_bp.after_request
+def stop_profiling(response):
+    """Store the request's profile and tell the client where to find it"""
+    session = g.pop('profiling_session', None)
+    if session is not None:
+        profile = session.stop()
+        response.headers['X-Profile-Id'] = profile['profile_id']
+        response.headers['X-Profile-Wall-Time'] = str(profile['wall_time_seconds'])
+    return response
+
+@ocr_bp.teardown_request
+def discard_profiling(error=None):
+    """Make sure a failed request does not leave the profiler running"""
+    session = g.pop('profiling_session', None)
+    if session is not None:
+        session.stop()
+
+@ocr_bp.after_request
+def compress_large_responses(response):
+    """Compress large JSON responses when the client accepts gzip or brotli"""
+    return compress_response(response, request.headers.get('Accept-Encoding', ''))
+
 def allowed_file(filename):
     """Check if file extension is allowed"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_client_key():
+    """Identify the client for fair scheduling: API key if given, else remote address"""
+    return request.headers.get('X-API-Key') or request.remote_addr or 'anonymous'
+
+def admission_rejected_response(error):
+    """Build a 429 response telling the client when to retry, or a 413 if it never fits"""
+    response = jsonify({
+        'success': False,
+        'error': str(error)
+    })
+    if isinstance(error, MemoryBudgetExceeded):
+        response.status_code = 413
+        return response
+    response.status_code = 429
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response
+
+def batch_admission(file_path, file_extension):
+    """
+    Admission callable for OCR'ing a file a batch of pages at a time.
+    Only the first batch can be turned away (429, or 413 if it can never fit);
+    later batches wait for capacity so a started document is not abandoned.
+    """
+    admitted = []
+    
+    def admit(pages=None, dpi=PDF_DPI):
+        if not admitted:
+            # The largest batch (full resolution) must fit before any work starts
+            admission_controller.check(ocr_manager.estimate_memory(file_path, file_extension))
+        memory_cost = ocr_manager.estimate_memory(file_path, file_extension, pages, dpi)
+        wait = bool(admitted)
+        admitted.append(True)
+        return admission_controller.admit(memory_cost, wait)
+    
+    return admit
+
+def store_drafts(file_id, engine_name, drafts, language):
+    """Persist progressive drafts as soon as they exist; a failure only costs the early preview"""
+    try:
+        result_store.save_drafts(file_id, engine_name, drafts, language)
+    except Exception as e:
+        logger.warning(f"Could not store drafts for {file_id}: {e}")
+
 @ocr_bp.route('/engines', methods=['GET'])
 def get_available_engines():
     """Get list of available OCR engines"""
@@ -42,6 +139,7 @@ def get_available_engines():
             'success': True,
             'engines': engines,
             'ai_correction_available': ai_available,
+            'local_correction_available': local_corrector.is_available(),
             'supported_formats': list(ALLOWED_EXTENSIONS)
         })
     except Exception as e:
@@ -53,7 +151,11 @@ def get_available_engines():
 
 @ocr_bp.route('/process', methods=['POST'])
 def process_file():
-    """Process uploaded file with OCR and AI correction"""
+    """
+    Process uploaded file with OCR and AI correction. Clients may pick the
+    file_id (a UUID) themselves, so with progressive=true they can poll
+    GET /results/<file_id> for the draft text while refinement runs.
+    """
     try:
         # Check if file is present
         if 'file' not in request.files:
@@ -80,10 +182,29 @@ def process_file():
         language = request.form.get('language', 'eng+ara')
         use_ai_correction = request.form.get('ai_correction', 'true').lower() == 'true'
         combination_method = request.form.get('combination_method', 'best_confidence')
+        local_mode = request.form.get('local_correction', 'prepass')
+        dedup_mode = request.form.get('dedup', PAGE_DEDUP_MODE)
+        progressive = request.form.get('progressive', 'false').lower() == 'true'
+        
+        file_id = request.form.get('file_id')
+        if file_id:
+            try:
+                file_id = str(uuid.UUID(file_id))
+            except ValueError:
+                return jsonify({
+                    'success': False,
+                    'error': 'file_id must be a UUID'
+                }), 400
+            if result_store.get_document(file_id) is not None:
+                return jsonify({
+                    'success': False,
+                    'error': 'file_id is already in use'
+                }), 409
+        else:
+            file_id = str(uuid.uuid4())
         
         # Save uploaded file
         filename = secure_filename(file.filename)
-        file_id = str(uuid.uuid4())
         file_extension = filename.rsplit('.', 1)[1].lower()
         temp_filename = f"{file_id}.{file_extension}"
         
@@ -94,74 +215,83 @@ def process_file():
         file_path = os.path.join(uploads_dir, temp_filename)
         file.save(file_path)
         
-        # Process based on file type
-        if file_extension == 'pdf':
-            ocr_results = ocr_manager.process_pdf(file_path, engines, language)
-        elif file_extension == 'txt':
-            # Handle external OCR text files
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text_content = f.read()
-            
-            external_engine_name = request.form.get('external_engine', 'External OCR')
-            confidence = float(request.form.get('confidence', 85.0))
-            
-            ocr_results = {
-                'external': ocr_manager.process_external_text(text_content, external_engine_name, confidence)
-            }
-        else:
-            # Image file
-            ocr_results = ocr_manager.process_image(file_path, engines, language)
+        settings = {
+            'engines': engines,
+            'language': language,
+            'ai_correction': use_ai_correction,
+            'local_correction': local_mode,
+            'combination_method': combination_method
+        }
         
-        # Combine OCR results
-        if len(ocr_results) > 1:
-            combined_result = ocr_manager.combine_results(ocr_results, combination_method)
-        else:
-            # Single engine result
-            engine_name = list(ocr_results.keys())[0]
+        # Reuse results of near-identical pages this client sent in earlier jobs
+        deduplicator = PageDeduplicator(page_hash_index, dedup_mode, get_client_key())
+        dedup = deduplicator if deduplicator.enabled() else None
+        
+        # Schedule pages fairly across clients, ahead of bulk work for small requests
+        page_count = ocr_manager.get_pdf_page_count(file_path) if file_extension == 'pdf' else None
+        priority = page_scheduler.classify(page_count or 1, request.form.get('priority'))
+        submit = page_scheduler.submitter(get_client_key(), priority)
+        
+        # Register the document up front so its status (and progressive
+        # drafts) can be polled under the file_id while OCR is running
+        stored = True
+        try:
+            result_store.save_document(file_id, filename, file_extension, file_path, page_count, settings)
+        except Exception as e:
+            logger.warning(f"Could not store OCR results for {file_id}: {e}")
+            stored = False
+        
+        # Wait for enough memory budget before rasterizing anything;
+        # PDFs are admitted a batch of rendered pages at a time
+        admit = batch_admission(file_path, file_extension)
+        try:
+            # Process based on file type
             if file_extension == 'pdf':
-                # For PDF, combine all pages
-                pages_text = []
-                for page_result in ocr_results[engine_name]:
-                    if page_result.get('success', False):
-                        pages_text.append(page_result['text'])
-                
-                combined_text = '\n\n'.join(pages_text)
-                avg_confidence = sum(page.get('confidence', 0) for page in ocr_results[engine_name]) / len(ocr_results[engine_name])
-                
-                combined_result = {
-                    'combined_text': combined_text,
-                    'confidence': avg_confidence,
-                    'method': 'single_engine',
-                    'engines_used': [engine_name],
-                    'success': bool(combined_text.strip()),
-                    'best_engine': engine_name
-                }
+                on_draft = (lambda engine_name, drafts: store_drafts(file_id, engine_name, drafts, language)) if stored else None
+                ocr_results = ocr_manager.process_pdf(file_path, engines, language, submit=submit, dedup=dedup,
+                                                      progressive=progressive, on_draft=on_draft, admit=admit)
             else:
-                result = ocr_results[engine_name]
-                combined_result = {
-                    'combined_text': result.get('text', ''),
-                    'confidence': result.get('confidence', 0),
-                    'method': 'single_engine',
-                    'engines_used': [engine_name],
-                    'success': result.get('success', False),
-                    'best_engine': engine_name
-                }
-        
-        # Apply AI correction if requested
-        ai_result = None
-        final_text = combined_result['combined_text']
-        
-        if use_ai_correction and ai_corrector.is_available() and combined_result['success']:
-            context = request.form.get('context', '')
-            ai_result = ai_corrector.correct_text(combined_result['combined_text'], language, context)
-            if ai_result['success']:
-                final_text = ai_result['corrected_text']
-        
-        # Clean up uploaded file
+                with admit():
+                    if file_extension == 'txt':
+                        # Handle external OCR text files
+                        with open(file_path, 'r', encoding='utf-8') as f:
+                            text_content = f.read()
+                        
+                        external_engine_name = request.form.get('external_engine', 'External OCR')
+                        confidence = float(request.form.get('confidence', 85.0))
+                        
+                        ocr_results = {
+                            'external': ocr_manager.process_external_text(text_content, external_engine_name, confidence)
+                        }
+                    else:
+                        # Image file
+                        ocr_results = ocr_manager.process_image(file_path, engines, language, submit=submit, dedup=dedup)
+        except AdmissionRejected as e:
+            result_store.delete_document(file_id)
+            try:
+                os.remove(file_path)
+            except:
+                pass
+            return admission_rejected_response(e)
+        
+        # Keep the OCR output (and the upload, for page re-runs) under the file_id
         try:
-            os.remove(file_path)
-        except:
-            pass
+            if not stored:
+                raise RuntimeError('document was not registered')
+            result_store.save_results(file_id, ocr_results, language)
+        except Exception as e:
+            logger.warning(f"Could not store OCR results for {file_id}: {e}")
+            result_store.delete_document(file_id)
+            try:
+                os.remove(file_path)
+            except:
+                pass
+        
+        combined_result = ocr_manager.combine_document_results(ocr_results, file_extension, combination_method)
+        context = request.form.get('context', '')
+        local_result, ai_result, final_text = ocr_manager.apply_corrections(
+            combined_result, ocr_results, language, local_corrector, ai_corrector, use_ai_correction, context, local_mode
+        )
         
         # Prepare response
         response_data = {
@@ -169,19 +299,17 @@ def process_file():
             'file_id': file_id,
             'filename': filename,
             'processing_time': datetime.now().isoformat(),
-            'ocr_results': ocr_results,
+            'ocr_results': ocr_manager.without_layout(ocr_results),
             'combined_result': combined_result,
+            'local_correction': local_result,
             'ai_correction': ai_result,
             'final_text': final_text,
-            'settings': {
-                'engines': engines,
-                'language': language,
-                'ai_correction': use_ai_correction,
-                'combination_method': combination_method
-            }
+            'draft_text': ocr_manager.get_draft_text(ocr_results),
+            'dedup_stats': deduplicator.get_stats(),
+            'settings': settings
         }
         
-        return jsonify(response_data)
+        return format_response(response_data, request.values.get('fields'), request.values.get('response_format'))
         
     except Exception as e:
         logger.error(f"Error processing file: {e}")
@@ -190,6 +318,212 @@ def process_file():
             'error': str(e)
         }), 500
 
+@ocr_bp.route('/results/<file_id>', methods=['GET'])
+def get_stored_results(file_id):
+    """Get information about OCR output stored under a file_id, with its processing status and any draft text"""
+    document = result_store.get_document(file_id)
+    if document is None:
+        return jsonify({
+            'success': False,
+            'error': 'No stored results for this file_id (unknown or expired)'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'document': document.to_dict(),
+        **result_store.get_status(document)
+    })
+
+@ocr_bp.route('/results/<file_id>', methods=['DELETE'])
+def delete_stored_results(file_id):
+    """Delete OCR output stored under a file_id"""
+    result_store.delete_document(file_id)
+    return '', 204
+
+@ocr_bp.route('/results/<file_id>/reprocess', methods=['POST'])
+def reprocess_file(file_id):
+    """Re-combine and re-correct stored OCR output with new settings"""
+    try:
+        document = result_store.get_document(file_id)
+        if document is None:
+            return jsonify({
+                'success': False,
+                'error': 'No stored results for this file_id (unknown or expired)'
+            }), 404
+        
+        data = request.get_json(silent=True) or {}
+        stored_settings = document.settings or {}
+        
+        engines = data.get('engines') or stored_settings.get('engines') or ['tesseract']
+        language = data.get('language', stored_settings.get('language', 'eng+ara'))
+        use_ai_correction = data.get('ai_correction', stored_settings.get('ai_correction', True))
+        combination_method = data.get('combination_method', stored_settings.get('combination_method', 'best_confidence'))
+        local_mode = data.get('local_correction', stored_settings.get('local_correction', 'prepass'))
+        dedup_mode = data.get('dedup', PAGE_DEDUP_MODE)
+        progressive = bool(data.get('progressive', False))
+        context = data.get('context', '')
+        
+        if document.file_extension == 'txt':
+            # External OCR text is stored as-is; there is nothing to re-run
+            engines = ['external']
+            language = stored_settings.get('language', language)
+        
+        ocr_results, missing = result_store.load_results(document, engines, language)
+        deduplicator = PageDeduplicator(page_hash_index, dedup_mode, get_client_key())
+        dedup = deduplicator if deduplicator.enabled() else None
+        
+        # Only OCR the engines and pages whose settings changed or that failed before
+        if missing:
+            if document.file_extension == 'txt' or not document.file_path or not os.path.exists(document.file_path):
+                return jsonify({
+                    'success': False,
+                    'error': 'Stored results do not cover these settings and the uploaded file is no longer available'
+                }), 409
+            
+            client_key = get_client_key()
+            for engine_name, pages in missing.items():
+                priority = page_scheduler.classify(len(pages) if pages else (document.page_count or 1), data.get('priority'))
+                submit = page_scheduler.submitter(client_key, priority)
+                admit = batch_admission(document.file_path, document.file_extension)
+                if document.file_extension == 'pdf':
+                    on_draft = lambda name, drafts: store_drafts(file_id, name, drafts, language)
+                    new_results = ocr_manager.process_pdf(document.file_path, [engine_name], language, pages, submit, dedup,
+                                                          progressive=progressive, on_draft=on_draft, admit=admit)
+                else:
+                    with admit():
+                        new_results = ocr_manager.process_image(document.file_path, [engine_name], language, submit, dedup)
+                
+                if engine_name not in new_results:
+                    continue
+                
+                result_store.save_results(file_id, new_results, language)
+                if document.file_extension == 'pdf' and engine_name in ocr_results:
+                    pages_by_number = {page['page_number']: page for page in ocr_results[engine_name]}
+                    pages_by_number.update({page['page_number']: page for page in new_results[engine_name]})
+                    ocr_results[engine_name] = [pages_by_number[number] for number in sorted(pages_by_number)]
+                else:
+                    ocr_results[engine_name] = new_results[engine_name]
+        
+        if not ocr_results:
+            return jsonify({
+                'success': False,
+                'error': 'None of the requested engines are available'
+            }), 400
+        
+        settings = {
+            'engines': engines,
+            'language': language,
+            'ai_correction': use_ai_correction,
+            'local_correction': local_mode,
+            'combination_method': combination_method
+        }
+        result_store.update_settings(document, settings)
+        
+        combined_result = ocr_manager.combine_document_results(ocr_results, document.file_extension, combination_method)
+        local_result, ai_result, final_text = ocr_manager.apply_corrections(
+            combined_result, ocr_results, language, local_corrector, ai_corrector, use_ai_correction, context, local_mode
+        )
+        
+        response_data = {
+            'success': True,
+            'file_id': file_id,
+            'filename': document.filename,
+            'processing_time': datetime.now().isoformat(),
+            'ocr_results': ocr_manager.without_layout(ocr_results),
+            'combined_result': combined_result,
+            'local_correction': local_result,
+            'ai_correction': ai_result,
+            'final_text': final_text,
+            'draft_text': ocr_manager.get_draft_text(ocr_results),
+            'dedup_stats': deduplicator.get_stats(),
+            'settings': settings
+        }
+        
+        return format_response(response_data, data.get('fields'), data.get('response_format'))
+        
+    except AdmissionRejected as e:
+        return admission_rejected_response(e)
+    except Exception as e:
+        logger.error(f"Error reprocessing file: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@ocr_bp.route('/results/<file_id>/export/<export_format>', methods=['GET', 'POST'])
+def export_results(file_id, export_format):
+    """
+    Stream stored OCR output as hOCR, ALTO XML or a searchable PDF, page by page.
+    Options come from the query string or a JSON body: engine, language,
+    corrected_text (e.g. final_text, mapped back onto the OCR'd words) and,
+    for PDFs, images=false to leave out the page images.
+    """
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({
+            'success': False,
+            'error': f'Export format not supported. Supported formats: {", ".join(EXPORT_FORMATS)}'
+        }), 400
+    
+    document = result_store.get_document(file_id)
+    if document is None:
+        return jsonify({
+            'success': False,
+            'error': 'No stored results for this file_id (unknown or expired)'
+        }), 404
+    
+    if document.file_extension == 'txt':
+        return jsonify({
+            'success': False,
+            'error': 'External OCR text has no word geometry to export'
+        }), 400
+    
+    data = request.args.to_dict()
+    data.update(request.get_json(silent=True) or {})
+    stored_settings = document.settings or {}
+    engine = data.get('engine') or (stored_settings.get('engines') or ['tesseract'])[0]
+    language = data.get('language', stored_settings.get('language', 'eng+ara'))
+    
+    if not result_store.has_results(document, engine, language):
+        return jsonify({
+            'success': False,
+            'error': f'No stored {engine} results for language {language}'
+        }), 404
+    
+    page_image = None
+    if export_format == 'pdf' and str(data.get('images', 'true')).lower() == 'true':
+        if not document.file_path or not os.path.exists(document.file_path):
+            return jsonify({
+                'success': False,
+                'error': 'The uploaded file is no longer available; export with images=false for a text-only PDF'
+            }), 409
+        page_image = lambda page_number: render_page_image(document.file_path, document.file_extension, page_number)
+    
+    def page_memory_cost(page_number):
+        # Pages are rendered at EXPORT_PDF_DPI rather than the OCR resolution
+        pages = [page_number] if document.file_extension == 'pdf' else None
+        return ocr_manager.estimate_memory(document.file_path, document.file_extension, pages, EXPORT_PDF_DPI)
+    
+    def admit_page(page_number):
+        # The response has started by now: wait for capacity rather than cut the file off
+        return admission_controller.admit(page_memory_cost(page_number), wait=True)
+    
+    if page_image is not None:
+        # Every page is estimated from the same size, so one check covers the whole stream
+        try:
+            admission_controller.check(page_memory_cost(1))
+        except AdmissionRejected as e:
+            return admission_rejected_response(e)
+    
+    # Results are read from the store and written out one page at a time
+    pages = result_store.iter_results(document, engine, language)
+    stream = export_document(export_format, pages, document.filename, data.get('corrected_text'), page_image, admit_page)
+    
+    mimetype, extension = EXPORT_FORMATS[export_format]
+    response = Response(stream_with_context(stream), mimetype=mimetype)
+    download_name = os.path.splitext(document.filename)[0] + extension
+    response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+    return response
+
 @ocr_bp.route('/correct-text', methods=['POST'])
 def correct_text():
     """Correct text using AI without OCR processing"""
@@ -205,6 +539,21 @@ def correct_text():
         text = data['text']
         language = data.get('language', 'mixed')
         context = data.get('context', '')
+        mode = data.get('mode', 'ai')
+        
+        # Offline mode, or fall back to it when no OpenAI key is configured
+        if mode == 'local' or (not ai_corrector.is_available() and local_corrector.is_available()):
+            if not local_corrector.is_available():
+                return jsonify({
+                    'success': False,
+                    'error': 'Local correction not available - dictionary index not configured'
+                }), 503
+            
+            result = local_corrector.correct_text(text, language, context)
+            return jsonify({
+                'success': True,
+                'result': result
+            })
         
         if not ai_corrector.is_available():
             return jsonify({
@@ -261,6 +610,24 @@ def suggest_improvements():
             'error': str(e)
         }), 500
 
+@ocr_bp.route('/profiles/<profile_id>/<artifact>', methods=['GET'])
+def download_profile(profile_id, artifact):
+    """Download a stored profile artifact: cpu (pstats), allocations (tracemalloc) or summary (text)"""
+    if not is_authorized(request.headers.get('X-Profile-Token')):
+        return jsonify({
+            'success': False,
+            'error': 'Profiling not authorized'
+        }), 403
+    
+    path = artifact_path(profile_id, artifact)
+    if path is None or not os.path.exists(path):
+        return jsonify({
+            'success': False,
+            'error': 'Profile not found'
+        }), 404
+    
+    return send_file(path, as_attachment=artifact != 'summary', download_name=os.path.basename(path))
+
 @ocr_bp.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
@@ -269,6 +636,11 @@ def health_check():
         'status': 'healthy',
         'engines_available': ocr_manager.get_available_engines(),
         'ai_available': ai_corrector.is_available(),
+        'local_correction_available': local_corrector.is_available(),
+        'admission': admission_controller.get_stats(),
+        'scheduler': page_scheduler.get_stats(),
+        'page_hash_index_size': len(page_hash_index),
+        'page_hash_index_bytes': page_hash_index.size_bytes,
         'timestamp': datetime.now().isoformat()
     })
 
@@ -0,0 +1,169 @@
+"""
+Scheduler Module
+Runs OCR work page by page on a shared worker pool, with weighted fair
+queuing across clients so small interactive requests are not stuck behind
+large batch jobs
+"""
+
+import os
+import time
+import heapq
+import itertools
+import threading
+import logging
+from collections import deque, defaultdict
+from concurrent.futures import Future
+from typing import Callable, Dict, Any, List, Optional
+from src.profiling import current_session
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Scheduler settings, configurable through the environment
+OCR_WORKERS = int(os.getenv('OCR_WORKERS', os.cpu_count() or 2))
+OCR_INTERACTIVE_MAX_PAGES = int(os.getenv('OCR_INTERACTIVE_MAX_PAGES', 5))
+
+# Share of the workers each priority class gets relative to the others
+PRIORITY_WEIGHTS = {
+    'interactive': 8.0,
+    'batch': 1.0
+}
+
+# Number of recent wait times kept per priority class for the statistics
+WAIT_SAMPLES = 1000
+
+class _PageTask:
+    """A single schedulable unit of OCR work"""
+
+    def __init__(self, fn: Callable, args: tuple, kwargs: dict, flow: tuple, start_tag: float):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.flow = flow
+        self.start_tag = start_tag
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+
+class PageScheduler:
+    """Start-time fair queuing of page tasks across (priority, client) flows"""
+
+    def __init__(self, workers: int = OCR_WORKERS):
+        self.workers = workers
+        self._heap = []
+        self._sequence = itertools.count()
+        self._virtual_time = 0.0
+        self._flow_finish = {}
+        self._flow_pending = {}
+        self._condition = threading.Condition()
+        self._queued = defaultdict(int)
+        self._wait_times = defaultdict(lambda: deque(maxlen=WAIT_SAMPLES))
+        self._completed = defaultdict(int)
+        self._threads = []
+        self._started = False
+
+    def _start(self):
+        # Workers are started lazily so importing the module stays cheap
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f'ocr-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        self._started = True
+        logger.info(f"Page scheduler started with {self.workers} workers")
+
+    def classify(self, page_count: int, requested: Optional[str] = None) -> str:
+        """Pick the priority class for a request; clients may only downgrade to batch"""
+        if requested == 'batch' or page_count > OCR_INTERACTIVE_MAX_PAGES:
+            return 'batch'
+        return 'interactive'
+
+    def submit(self, fn: Callable, *args, client: str = 'anonymous', priority: str = 'interactive', **kwargs) -> Future:
+        """Queue one page of work and return a future for its result"""
+        weight = PRIORITY_WEIGHTS.get(priority, PRIORITY_WEIGHTS['batch'])
+        flow = (priority, client)
+        
+        # Pages of a profiled request are profiled on the worker thread too
+        session = current_session()
+        if session is not None:
+            fn = session.wrap(fn)
+
+        with self._condition:
+            if not self._started:
+                self._start()
+
+            # A flow that has been idle restarts at the current virtual time,
+            # so it cannot bank credit while another flow is busy
+            start_tag = max(self._virtual_time, self._flow_finish.get(flow, 0.0))
+            self._flow_finish[flow] = start_tag + 1.0 / weight
+            self._flow_pending[flow] = self._flow_pending.get(flow, 0) + 1
+
+            task = _PageTask(fn, args, kwargs, flow, start_tag)
+            heapq.heappush(self._heap, (start_tag, next(self._sequence), task))
+            self._queued[priority] += 1
+            self._condition.notify()
+
+        return task.future
+
+    def submitter(self, client: str, priority: str) -> Callable[..., Future]:
+        """Bind a client and priority class, for passing into OCRManager"""
+        def submit(fn: Callable, *args, **kwargs) -> Future:
+            return self.submit(fn, *args, client=client, priority=priority, **kwargs)
+        return submit
+
+    def _worker(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+
+                start_tag, _, task = heapq.heappop(self._heap)
+                self._virtual_time = max(self._virtual_time, start_tag)
+                priority = task.flow[0]
+                self._queued[priority] -= 1
+                self._wait_times[priority].append(time.monotonic() - task.enqueued_at)
+
+            ran = task.future.set_running_or_notify_cancel()
+            if ran:
+                try:
+                    task.future.set_result(task.fn(*task.args, **task.kwargs))
+                except BaseException as e:
+                    task.future.set_exception(e)
+
+            with self._condition:
+                if ran:
+                    self._completed[priority] += 1
+
+                # Forget flows without pending pages so the table does not grow with every client
+                self._flow_pending[task.flow] -= 1
+                if not self._flow_pending[task.flow]:
+                    del self._flow_pending[task.flow]
+                    self._flow_finish.pop(task.flow, None)
+
+    @staticmethod
+    def _percentile(samples: List[float], percentile: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(round(percentile / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get queue depth and wait time statistics per priority class"""
+        with self._condition:
+            classes = {}
+            for priority in PRIORITY_WEIGHTS:
+                waits = list(self._wait_times[priority])
+                classes[priority] = {
+                    'queued_pages': self._queued[priority],
+                    'completed_pages': self._completed[priority],
+                    'wait_p50_seconds': round(self._percentile(waits, 50), 4),
+                    'wait_p95_seconds': round(self._percentile(waits, 95), 4),
+                    'wait_max_seconds': round(max(waits), 4) if waits else 0.0
+                }
+
+            return {
+                'workers': self.workers,
+                'queued_pages': len(self._heap),
+                'active_flows': len(self._flow_finish),
+                'classes': classes
+            }
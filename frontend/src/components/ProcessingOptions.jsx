@@ -93,6 +93,7 @@ const ProcessingOptions = ({
                 <SelectValue />
               </SelectTrigger>
               <SelectContent>
+                <SelectItem value="auto">Auto-detect</SelectItem>
                 <SelectItem value="eng+ara">Arabic + English</SelectItem>
                 <SelectItem value="eng">English Only</SelectItem>
                 <SelectItem value="ara">Arabic Only</SelectItem>
@@ -85,6 +85,20 @@ class APIService {
     });
   }
 
+  // Re-combine or re-correct stored OCR output without re-uploading the file
+  async reprocessFile(fileId, options = {}) {
+    return this.request(`/ocr/results/${fileId}/reprocess`, {
+      method: 'POST',
+      body: JSON.stringify({
+        engines: options.engines,
+        language: options.language,
+        ai_correction: options.aiCorrection,
+        combination_method: options.combinationMethod,
+        context: options.context,
+      }),
+    });
+  }
+
   // Correct text using AI without OCR processing
   async correctText(text, language = 'mixed', context = '') {
     return this.request('/ocr/correct-text', {
@@ -122,6 +136,7 @@ export default apiService;
 export const {
   getEngines,
   processFile,
+  reprocessFile,
   correctText,
   getSuggestions,
   healthCheck,